@@ -32,11 +32,12 @@ SYMBOL = "KEQ"
 exchange_uri = 'exchange'
 new_endpoint = '/v1/order/new'
 status_endpoint = '/v1/order/status'
+status_batch_endpoint = '/v1/order/status/batch'
 edit_endpoint = '/v1/order/edit'
 cancel_endpoint = '/v1/order/cancel'
-verify_endpoint = '/v1/quote/verify'
 price_endpoint = '/v1/price/best'
 trade_details_endpoint = '/v1/trade/details'
+trade_details_batch_endpoint = '/v1/trade/details/batch'
 
 class AccountCreateView(viewsets.GenericViewSet):
     queryset = Account.objects.all()
@@ -125,31 +126,21 @@ class OrderViewSet(viewsets.ModelViewSet):
                     }
             }
             try:
-                check_quote = requests.post(url=f"{exchange_uri}{verify_endpoint}",
+                place_order = requests.post(url=f"{exchange_uri}{new_endpoint}",
                     headers={"Content-Type": "application/json"},
                     data=json.dumps(quote))
+                order = place_order.json()
+                if "order" in order:
+                    serializer = self._update_order_trades_price(order)
+                    if isinstance(serializer, Response):
+                        return serializer
+                else:
+                    return Response({"errors": order["errors"],
+                        "status_code": status.HTTP_400_BAD_REQUEST})
             except Exception as e:
                 return Response({"errors": [{"API_ERROR": str(e)}],
-                    "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
-            valid_quote = check_quote.json()["valid"]
-            if valid_quote:
-                try:
-                    place_order = requests.post(url=f"{exchange_uri}{new_endpoint}",
-                        headers={"Content-Type": "application/json"},
-                        data=json.dumps(quote))
-                    order = place_order.json()
-                    if "order" in order:
-                        serializer = self._update_order_trades_price(order)
-                    else:
-                        return Response({"errors": order["errors"],
-                            "status_code": status.HTTP_400_BAD_REQUEST})
-                except Exception as e:
-                    return Response({"errors": [{"API_ERROR": str(e)}],
-                    "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response({"errors": [{"ORDER_ERROR": "Invalid quote."}],
-                    "status_code": status.HTTP_400_BAD_REQUEST})
+                "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response({"errors": [{"ORDER_ERROR": "Incorrect account ID or API Key."}],
                 "status_code": status.HTTP_401_UNAUTHORIZED})
@@ -206,32 +197,22 @@ class OrderViewSet(viewsets.ModelViewSet):
             if "price" in updated_data:
                 quote["quote"]["price"] = updated_data["price"]
             try:
-                check_quote = requests.post(url=f"{exchange_uri}{verify_endpoint}",
+                edit_order = requests.post(url=f"{exchange_uri}{edit_endpoint}",
                     headers={"Content-Type": "application/json"},
                     data=json.dumps(quote))
+                new_order = edit_order.json()
+                if "order" in new_order:
+                    serializer = self._update_order_trades_price(new_order)
+                    if isinstance(serializer, Response):
+                        return serializer
+                    order.delete()
+                else:
+                    return Response({"errors": new_order["errors"],
+                        "status_code": status.HTTP_400_BAD_REQUEST})
             except Exception as e:
                 return Response({"errors": [{"API_ERROR": str(e)}],
-                    "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
-            valid_quote = check_quote.json()["valid"]
-            if valid_quote:
-                try:
-                    edit_order = requests.post(url=f"{exchange_uri}{edit_endpoint}",
-                        headers={"Content-Type": "application/json"},
-                        data=json.dumps(quote))
-                    new_order = edit_order.json()
-                    if "order" in new_order:
-                        serializer = self._update_order_trades_price(new_order)
-                        order.delete()
-                    else:
-                        return Response({"errors": new_order["errors"],
-                            "status_code": status.HTTP_400_BAD_REQUEST})
-                except Exception as e:
-                    return Response({"errors": [{"API_ERROR": str(e)}],
-                    "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response({"errors": [{"ORDER_ERROR": "Invalid quote."}],
-                    "status_code": status.HTTP_400_BAD_REQUEST})
+                "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response({"errors": [{"ORDER_ERROR": "Incorrect account ID or API Key."}],
                 "status_code": status.HTTP_401_UNAUTHORIZED})
@@ -274,45 +255,55 @@ class OrderViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data = new_order["order"])
         serializer.is_valid(raise_exception = True)
         serializer.save()
-        for trade in trades:
+        known_trades = set(Trade.objects.filter(trade_id__in = trades).values_list("trade_id", flat = True))
+        new_trades = [trade for trade in trades if trade not in known_trades]
+        if new_trades:
             try:
-                trade_object = Trade.objects.get(trade_id = trade)
-            except:
-                try:
-                    trade_details = requests.post(url=f"{exchange_uri}{trade_details_endpoint}",
-                        headers={"Content-Type": "application/json"},
-                        data=json.dumps({"trade_id": trade}))
-                except Exception as e:
-                    return Response({"errors": [{"API_ERROR": str(e)}],
-                        "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
-                if "trade" in trade_details.json():
-                    new_trade = trade_details.json()["trade"]
+                trade_details = requests.post(url=f"{exchange_uri}{trade_details_batch_endpoint}",
+                    headers={"Content-Type": "application/json"},
+                    data=json.dumps({"trade_ids": new_trades}))
+            except Exception as e:
+                return Response({"errors": [{"API_ERROR": str(e)}],
+                    "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
+            trade_details = trade_details.json()
+            if "errors" in trade_details:
+                return Response({"errors": trade_details["errors"],
+                    "status_code": status.HTTP_400_BAD_REQUEST})
+            update_orders = []
+            for trade in trade_details["trades"]:
+                if "trade" in trade:
+                    new_trade = trade["trade"]
                     new_trade["created_at"] = new_trade["timestamp"]
                     new_trade["buyer"] = new_trade["buyer"][0]
                     new_trade["seller"] = new_trade["seller"][0]
-                    update_orders = [new_trade["buying_order"], new_trade["selling_order"]]
+                    update_orders.extend([new_trade["buying_order"], new_trade["selling_order"]])
                     trade_serializer = TradeSerializer(data = new_trade)
                     trade_serializer.is_valid(raise_exception = True)
                     trade_serializer.save()
-                    for orders in update_orders:
-                        try:
-                            order_details = requests.post(url=f"{exchange_uri}{status_endpoint}",
-                                headers={"Content-Type": "application/json"},
-                                data=json.dumps({"order_id": orders}))
-                        except Exception as e:
-                            return Response({"errors": [{"API_ERROR": str(e)}],
-                                "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
-                        if "order" in order_details.json():
-                            updated_order = Order.objects.get(order_id = orders)
-                            updated_order.quantity = order_details.json()["order"]["quantity"]
-                            updated_order.was_filled = order_details.json()["order"]["was_filled"]
-                            updated_order.save()
-                        else:
-                            return Response({"errors": order_details["errors"],
-                                "status_code": status.HTTP_400_BAD_REQUEST})
                 else:
                     return Response({"errors": trade["errors"],
                         "status_code": status.HTTP_400_BAD_REQUEST})
+            update_orders = list(dict.fromkeys(update_orders))
+            try:
+                order_details = requests.post(url=f"{exchange_uri}{status_batch_endpoint}",
+                    headers={"Content-Type": "application/json"},
+                    data=json.dumps({"order_ids": update_orders}))
+            except Exception as e:
+                return Response({"errors": [{"API_ERROR": str(e)}],
+                    "status_code": status.HTTP_503_SERVICE_UNAVAILABLE})
+            order_details = order_details.json()
+            if "errors" in order_details:
+                return Response({"errors": order_details["errors"],
+                    "status_code": status.HTTP_400_BAD_REQUEST})
+            for orders, order_detail in zip(update_orders, order_details["orders"]):
+                if "order" in order_detail:
+                    updated_order = Order.objects.get(order_id = orders)
+                    updated_order.quantity = order_detail["order"]["quantity"]
+                    updated_order.was_filled = order_detail["order"]["was_filled"]
+                    updated_order.save()
+                else:
+                    return Response({"errors": order_detail["errors"],
+                        "status_code": status.HTTP_400_BAD_REQUEST})
         serializer.save(trades = trades)
         try:
             price_details = requests.get(url=f"{exchange_uri}{price_endpoint}")
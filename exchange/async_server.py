@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+import exchange
+
+
+OFFLOAD_WORKERS = 64
+# Views that only read published book views or in-process state are cheap enough to run on the loop.
+INLINE_ENDPOINTS = {"check", "price", "order_book", "persistence_stats"}
+STATUS_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+                  405: "Method Not Allowed", 500: "Internal Server Error", 501: "Not Implemented"}
+
+executor = ThreadPoolExecutor(OFFLOAD_WORKERS)
+url_adapter = exchange.app.url_map.bind("localhost")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if exchange.sequencer is None:
+                    exchange.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    status, payload, headers = await handle(scope["method"], scope["path"], scope["query_string"].decode("latin-1"),
+                                            body, _header(scope, b"if-none-match"))
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(payload)).encode())] + headers})
+    await send({"type": "http.response.body", "body": payload})
+
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+async def handle(method, path, query_string, body, if_none_match=None):
+    try:
+        endpoint = url_adapter.match(path, method)[0]
+    except HTTPException as err:
+        return err.code, _error_body(err.code), []
+    if endpoint in INLINE_ENDPOINTS:
+        return call_view(endpoint, method, path, query_string, body, if_none_match)
+    # Everything else waits on the sequencer or Mongo, so it runs on a worker thread.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, call_view, endpoint, method, path, query_string, body,
+                                      if_none_match)
+
+def call_view(endpoint, method, path, query_string, body, if_none_match=None):
+    headers = {"If-None-Match": if_none_match} if if_none_match else None
+    with exchange.app.test_request_context(path, method=method, query_string=query_string, data=body,
+                                           content_type="application/json", headers=headers):
+        try:
+            response = exchange.app.view_functions[endpoint]()
+        except HTTPException as err:
+            return err.code, _error_body(err.code), []
+        except Exception:
+            return 500, _error_body(500), []
+    if isinstance(response, str):
+        return 200, response.encode(), []
+    etag = response.headers.get("ETag")
+    return response.status_code, response.get_data(), [(b"etag", etag.encode("latin-1"))] if etag else []
+
+def _error_body(status):
+    return ('{"errors": [{"HTTP_ERROR": "%s"}]}' % STATUS_REASONS.get(status, "Error")).encode()
+
+async def serve(asgi_app, host="0.0.0.0", port=5000, backlog=4096):
+    async def handle_connection(reader, writer):
+        try:
+            await _serve_connection(asgi_app, reader, writer)
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle_connection, host, port, backlog=backlog)
+
+async def _serve_connection(asgi_app, reader, writer):
+    while True:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        if "transfer-encoding" in headers:
+            writer.write(_response_head(501, 0, False))
+            await writer.drain()
+            return
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        path, _, query_string = target.partition("?")
+        scope = {"type": "http", "http_version": version[5:], "method": method, "path": path,
+                 "query_string": query_string.encode("latin-1"),
+                 "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]}
+        response = {}
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = message["headers"]
+            else:
+                response["body"] = message.get("body", b"")
+
+        await asgi_app(scope, receive, send)
+        payload = response.get("body", b"")
+        extra_headers = [(name, value) for name, value in response.get("headers", ())
+                         if name not in (b"content-type", b"content-length")]
+        writer.write(_response_head(response.get("status", 500), len(payload), keep_alive, extra_headers) + payload)
+        await writer.drain()
+        if not keep_alive:
+            return
+
+def _response_head(status, length, keep_alive, headers=()):
+    extra = "".join(f"{name.decode('latin-1')}: {value.decode('latin-1')}\r\n" for name, value in headers)
+    return (f"HTTP/1.1 {status} {STATUS_REASONS.get(status, 'Error')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {length}\r\n{extra}"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1")
+
+async def _run(host, port):
+    server = await serve(app, host, port)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    global executor
+    parser = argparse.ArgumentParser(description="Serve the exchange API from an asyncio event loop. Commands "
+                                                 "are handed to the matching thread through worker threads.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=OFFLOAD_WORKERS,
+                        help="threads that wait on the sequencer and Mongo for blocking endpoints")
+    args = parser.parse_args()
+    executor = ThreadPoolExecutor(args.workers)
+    exchange.start()
+    asyncio.run(_run(args.host, args.port))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+from decimal import Decimal
+import inspect
+import os
+import pickle
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+
+from orderbook import OrderBook
+from orderbook import Error
+from results import report_results
+from snapshot import dump_book, dump_snapshot, load_snapshot_file
+from test_quotes import create_random_quote
+
+
+def _fill_book(orderbook, levels, orders_per_level, quantity):
+    for level in range(levels):
+        for i in range(orders_per_level):
+            orderbook.process_order({
+                "account_id": str(i),
+                "side": "SELL",
+                "order_type": "LIMIT",
+                "symbol": orderbook.symbol,
+                "price": Decimal(100) + level,
+                "quantity": quantity
+            })
+
+def _sweep(orderbook, quantity):
+    report = orderbook.process_order({
+        "account_id": "sweeper",
+        "side": "BUY",
+        "order_type": "MARKET",
+        "symbol": orderbook.symbol,
+        "quantity": quantity
+    })
+    report.to_dict()
+    return len(report.trades)
+
+def _percentile(samples, percentile):
+    return samples[min(len(samples) - 1, int(len(samples) * percentile))]
+
+def bench_sweep(levels=50, orders_per_level=20, rounds=20, quantity=10, tick_size=None, price_band=None):
+    orderbook = OrderBook("KEQ", tick_size, price_band)
+    fills = 0
+    elapsed = 0
+    allocated = 0
+    for trace in (False, True):
+        for _ in range(rounds):
+            _fill_book(orderbook, levels, orders_per_level, quantity)
+            if trace:
+                tracemalloc.start()
+                _sweep(orderbook, levels * orders_per_level * quantity)
+                allocated += tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                start = time.perf_counter()
+                fills += _sweep(orderbook, levels * orders_per_level * quantity)
+                elapsed += time.perf_counter() - start
+    return {
+        "fills": fills,
+        "us_per_fill": elapsed / fills * 1e6,
+        "peak_bytes_per_fill": allocated / fills
+    }
+
+def random_quotes(count, symbol="KEQ", price_range=(50, 55), market_ratio=0.5, seed=1):
+    rng = random.Random(seed)
+    for _ in range(count):
+        quote = create_random_quote(symbol, price_range[0], price_range[1], market_ratio, rng)
+        if quote["price"] is not None:
+            quote["price"] = Decimal(str(quote["price"]))
+        yield quote
+
+def _seed_book(orderbook, depth, price_range, seed):
+    midpoint = (price_range[0] + price_range[1]) // 2
+    rng = random.Random(seed)
+    for side, floor, ceiling in (("BUY", price_range[0], midpoint), ("SELL", midpoint, price_range[1])):
+        for _ in range(depth):
+            quote = create_random_quote(orderbook.symbol, floor, max(ceiling, floor + 1), 0, rng)
+            quote["side"] = side
+            quote["price"] = Decimal(str(quote["price"]))
+            orderbook.process_order(quote)
+
+def bench_stream(orders=100000, depth=1000, market_ratio=0.2, cancel_ratio=0.2, price_range=(50, 55),
+                 seed=1, tick_size=None, price_band=None):
+    orderbook = OrderBook("KEQ", tick_size, price_band)
+    _seed_book(orderbook, depth, price_range, seed)
+    rng = random.Random(seed + 1)
+    resting = list(orderbook.orders)
+    latencies = []
+    fills = 0
+    rejects = 0
+    cancels = 0
+    start = time.perf_counter()
+    for quote in random_quotes(orders, orderbook.symbol, price_range, market_ratio, seed):
+        if resting and rng.random() < cancel_ratio:
+            index = rng.randrange(len(resting))
+            resting[index], resting[-1] = resting[-1], resting[index]
+            order_id = resting.pop()
+            order_start = time.perf_counter_ns()
+            try:
+                orderbook.cancel_order(order_id)
+                cancels += 1
+            except Error:
+                rejects += 1
+            latencies.append(time.perf_counter_ns() - order_start)
+            continue
+        order_start = time.perf_counter_ns()
+        try:
+            report = orderbook.process_order(quote)
+            fills += len(report.trades)
+            if report.order.quantity:
+                resting.append(report.order.order_id)
+        except Error:
+            rejects += 1
+        latencies.append(time.perf_counter_ns() - order_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "commands": len(latencies),
+        "fills": fills,
+        "cancels": cancels,
+        "rejects": rejects,
+        "resting_orders": len(orderbook.orders),
+        "orders_per_sec": len(latencies) / elapsed,
+        "fills_per_sec": fills / elapsed,
+        "p50_us": _percentile(latencies, 0.5) / 1000,
+        "p99_us": _percentile(latencies, 0.99) / 1000,
+        "p999_us": _percentile(latencies, 0.999) / 1000,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+def bench_restart(resting_orders=10000, levels=1000, tick_size=None, price_band=None):
+    orderbook = OrderBook("KEQ", tick_size, price_band)
+    _fill_book(orderbook, levels, max(1, resting_orders // levels), 10)
+    with tempfile.TemporaryDirectory() as directory:
+        results = {"resting_orders": len(orderbook.orders)}
+        for name, dump, load in (
+            ("pickle", pickle.dumps, pickle.load),
+            ("snapshot", lambda book: dump_snapshot(0, [dump_book(book)]), load_snapshot_file)
+        ):
+            snapshot_file = os.path.join(directory, name)
+            start = time.perf_counter()
+            data = dump(orderbook)
+            results[f"{name}_dump_s"] = time.perf_counter() - start
+            results[f"{name}_bytes"] = len(data)
+            with open(snapshot_file, "wb") as f:
+                f.write(data)
+            del data
+            start = time.perf_counter()
+            if name == "pickle":
+                with open(snapshot_file, "rb") as f:
+                    restored = load(f)
+            else:
+                restored = load(snapshot_file)[1][0]
+            results[f"{name}_load_s"] = time.perf_counter() - start
+            assert len(restored.orders) == len(orderbook.orders)
+            del restored
+    results["load_speedup"] = results["pickle_load_s"] / results["snapshot_load_s"]
+    return results
+
+SCENARIOS = {
+    "sweep": (bench_sweep, {"levels": 50, "orders_per_level": 20, "rounds": 20}),
+    "deep-sweep": (bench_sweep, {"levels": 2000, "orders_per_level": 1, "rounds": 10}),
+    "stream": (bench_stream, {}),
+    "restart": (bench_restart, {})
+}
+
+def run_scenario(scenario, overrides=None):
+    function, defaults = SCENARIOS[scenario]
+    parameters = inspect.signature(function).parameters
+    options = {key: parameter.default for key, parameter in parameters.items()}
+    options.update(defaults)
+    for key, value in (overrides or {}).items():
+        if value is not None and key in parameters:
+            options[key] = value
+    return options, function(**options)
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching engine benchmarks. No Redis or Mongo required.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append",
+                        help="scenario to run (default: all)")
+    parser.add_argument("--levels", type=int)
+    parser.add_argument("--orders-per-level", type=int)
+    parser.add_argument("--rounds", type=int)
+    parser.add_argument("--orders", type=int, help="stream: number of commands")
+    parser.add_argument("--depth", type=int, help="stream: resting orders seeded per side")
+    parser.add_argument("--market-ratio", type=float, help="stream: share of market orders")
+    parser.add_argument("--cancel-ratio", type=float, help="stream: share of commands that cancel")
+    parser.add_argument("--price-range", type=int, nargs=2, metavar=("FLOOR", "CEILING"),
+                        help="stream: random limit price range")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--resting-orders", type=int, help="restart: resting orders in the snapshotted book")
+    parser.add_argument("--tick-size", help="run the engine on integer ticks of this size")
+    parser.add_argument("--price-band", nargs=2, metavar=("LOW", "HIGH"),
+                        help="use an array price ladder over this band (requires --tick-size)")
+    parser.add_argument("--output", help="append results as JSON lines to this file")
+    args = parser.parse_args()
+    for scenario in args.scenario or ["deep-sweep", "sweep", "stream"]:
+        options, results = run_scenario(scenario, vars(args))
+        report_results(scenario, results, args.output, scenario=scenario, options=options)
+
+if __name__ == "__main__":
+    main()
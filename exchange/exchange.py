@@ -1,33 +1,76 @@
+import atexit
 from datetime import datetime
 from decimal import Decimal
+import heapq
 import json
 from os import path
 import pickle
+import signal
+import sys
+import time
+import uuid
 
-from bson.binary import Binary
 from flask import Flask, request
+import gridfs
 from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 from redis import StrictRedis, RedisError
 
-from orderbook import OrderBook
-from orderbook import OrderError, PriceError, MarketError
+from cache import LRUCache
+from journal import Journal, SnapshotWriter
+from orderbook import Error, OrderError, PriceError, MarketError
+from registry import OrderBookRegistry, ShardedOrderBookRegistry
+from replay import apply_command, command_book, command_call
+from results import print_results
+from risk import RiskEngine, RiskError
+from sequencer import Sequencer
+from snapshot import ACCOUNT_ID_BYTES, SnapshotError, dump_snapshot, load_snapshot, load_snapshot_file
+from writer import BulkWriter
 
 
 STOCK_SYMBOL = "KEQ"
-ORDERBOOK_FILE = 'orderbook.pickle'
+LISTED_SYMBOLS = [STOCK_SYMBOL]
+SHARD_WORKERS = 0
+SHARD_PINS = {}
+TICK_SIZE = None
+PRICE_BAND = None
+ORDERBOOK_FILE = 'orderbook_{symbol}.pickle'
+LEGACY_ORDERBOOK_FILE = 'orderbook.pickle'
+JOURNAL_DIR = 'journal'
+ORDERS_KEY = 'orders:{symbol}'
+ORDER_SYMBOLS_KEY = 'order_symbols'
+REDIS_STATE_KEY = 'exchange_state'
+REDIS_LOAD_BATCH = 10000
+COMPLETED_CACHE_SIZE = 100000
+TRADE_CACHE_SIZE = 100000
+SNAPSHOT_INTERVAL = 1000
+SEQUENCER_BATCH = 256
+WRITER_FLUSH_TIMEOUT = 2.0
+RISK_LIMITS = {}
+ACCOUNT_RISK_LIMITS = {}
+
+ENGINE_ERRORS = {OrderError: "ORDER_ERROR", MarketError: "MARKET_ERROR", PriceError: "PRICE_ERROR",
+                 RiskError: "RISK_ERROR"}
 
 app = Flask(__name__)
 redis = StrictRedis(host="redis", port=6379, db=0, charset="utf-8", decode_responses=True)
 mongo = MongoClient(host="mongo")
 db = mongo.exchange_db
+completed_cache = LRUCache(COMPLETED_CACHE_SIZE)
+trade_cache = LRUCache(TRADE_CACHE_SIZE)
+redis_dirty = False
+startup_timings = {}
+book_views = {}
+book_listeners = []
+sequencer = None
+risk = None
 
 @app.route("/v1/quote/verify", methods=["POST"])
 def check():
     quote = request.get_json()["quote"]
     if "price" in quote:
         quote["price"] = Decimal(quote["price"])
-    valid, errors = _check_quote(quote)
+    valid, errors = check_quote(quote)
     response = {}
     response["valid"] = valid
     if not valid:
@@ -41,23 +84,14 @@ def process():
     quote = request.get_json()["quote"]
     if "price" in quote:
         quote["price"] = Decimal(quote["price"])
-    valid, errors = _check_quote(quote)
+    valid, errors = check_quote(quote)
     response = {}
+    if request.get_json().get("validate_only"):
+        return _validate_only(quote, valid, errors)
     if valid:
         try:
-            order = json.loads(orderbook.process_order(quote))
-            _backup_orderbook(orderbook)
-            order["was_placed"] = True
-            order["was_filled"] = False
-            try:
-                redis.set(order["order_id"], json.dumps(order))
-                _update_redis()
-            except RedisError as err:
-                errors.append({"REDIS_ERROR": str(err)})
-                pass
-            if order["order_id"] not in str(redis.keys()):
-                order["was_filled"] = True
-            response["order"] = order
+            record = {"command": "new", "quote": quote, "order_id": str(uuid.uuid4()), "timestamp": datetime.now()}
+            response["order"] = _submit(record, errors)
         except OrderError as err:
             errors.append({"ORDER_ERROR": str(err)})
             pass
@@ -67,6 +101,47 @@ def process():
         except PriceError as err:
             errors.append({"PRICE_ERROR": str(err)})
             pass
+        except RiskError as err:
+            errors.append({"RISK_ERROR": str(err)})
+            pass
+    if errors:
+        response["errors"] = errors
+    return json.dumps(response)
+
+@app.route("/v1/order/batch", methods=["POST"])
+def process_batch():
+    quotes = request.get_json()["quotes"]
+    orders = []
+    accepted = {}
+    for quote in quotes:
+        if "price" in quote:
+            quote["price"] = Decimal(quote["price"])
+        valid, errors = check_quote(quote)
+        order_response = {}
+        if valid:
+            accepted.setdefault(quote["symbol"], []).append((quote, order_response))
+        else:
+            order_response["errors"] = errors
+        orders.append(order_response)
+    response = {}
+    errors = []
+    records = []
+    for symbol_quotes in accepted.values():
+        batch_quotes = [quote for quote, order_response in symbol_quotes]
+        records.append({"command": "batch", "quotes": batch_quotes,
+                        "order_ids": [str(uuid.uuid4()) for _ in batch_quotes],
+                        "timestamps": [datetime.now()] * len(batch_quotes)})
+    for symbol_quotes, outcome in zip(accepted.values(), sequencer.submit_all(records)):
+        if "redis_error" in outcome and {"REDIS_ERROR": outcome["redis_error"]} not in errors:
+            errors.append({"REDIS_ERROR": outcome["redis_error"]})
+        for (quote, order_response), result in zip(symbol_quotes, outcome["result"]):
+            if isinstance(result, Exception):
+                order_response["errors"] = [{ENGINE_ERRORS[type(result)]: str(result)}]
+            else:
+                order_response["order"] = result
+    response["orders"] = orders
+    current_time = str(datetime.now())
+    response["timestamp"] = current_time
     if errors:
         response["errors"] = errors
     return json.dumps(response)
@@ -77,23 +152,35 @@ def status():
     response = {}
     errors = []
     try:
-        if order_id not in str(redis.keys()):
-            order_store = db.orders.find({'order_id': order_id}, {"_id": 0}).limit(1)
-            if order_store.count() > 0:
-                order = order_store[0]
-                order["was_placed"] = True
-                order["was_filled"] = True
-            else:
-                order = {}
-                response["errors"] = [{"ORDER_ERROR": "No order with that order ID currently exists."}]
-        else:
-            order = json.loads(redis.get(order_id))
-            order["was_placed"] = True
-            order["was_filled"] = False
+        order = _get_orders([order_id]).get(order_id)
+        if order is None:
+            order = {}
+            response["errors"] = [{"ORDER_ERROR": "No order with that order ID currently exists."}]
         response["order"] = order
-    except RedisError as err:
-        errors.append({"REDIS_ERROR": str(err)})
+    except PyMongoError as err:
+        errors.append({"MONGODB_ERROR": str(err)})
+        pass
+    if errors:
+        response["errors"] = errors
+    return json.dumps(response)
+
+@app.route("/v1/order/status/batch", methods=["POST"])
+def status_batch():
+    order_ids = request.get_json()["order_ids"]
+    response = {}
+    errors = []
+    try:
+        orders = _get_orders(order_ids)
+        response["orders"] = [
+            {"order": orders[order_id]} if order_id in orders else
+            {"errors": [{"ORDER_ERROR": "No order with that order ID currently exists."}]}
+            for order_id in order_ids
+        ]
+    except PyMongoError as err:
+        errors.append({"MONGODB_ERROR": str(err)})
         pass
+    current_time = str(datetime.now())
+    response["timestamp"] = current_time
     if errors:
         response["errors"] = errors
     return json.dumps(response)
@@ -104,24 +191,15 @@ def modify():
     if "price" in quote:
         quote["price"] = Decimal(quote["price"])
     order_id = request.get_json()["order_id"]
-    valid, errors = _check_quote(quote)
+    valid, errors = check_quote(quote)
     response = {}
+    if request.get_json().get("validate_only"):
+        return _validate_only(quote, valid, errors, order_id)
     if valid:
         try:
-            new_order = json.loads(orderbook.modify_order(order_id, quote))
-            _backup_orderbook(orderbook)
-            new_order["was_placed"] = True
-            new_order["was_filled"] = False
-            try:
-                redis.delete(order_id)
-                redis.set(new_order["order_id"], json.dumps(new_order))
-                _update_redis()
-            except RedisError as err:
-                errors.append({"REDIS_ERROR": str(err)})
-                pass
-            if new_order["order_id"] not in str(redis.keys()):
-                new_order["was_filled"] = True
-            response["order"] = new_order
+            record = {"command": "edit", "order_id": order_id, "quote": quote, "new_order_id": str(uuid.uuid4()),
+                      "timestamp": datetime.now()}
+            response["order"] = _submit(record, errors)
         except OrderError as err:
             errors.append({"ORDER_ERROR": str(err)})
             pass
@@ -131,8 +209,11 @@ def modify():
         except PriceError as err:
             errors.append({"PRICE_ERROR": str(err)})
             pass
-        if errors:
-            response["errors"] = errors
+        except RiskError as err:
+            errors.append({"RISK_ERROR": str(err)})
+            pass
+    if errors:
+        response["errors"] = errors
     return json.dumps(response)
 
 @app.route("/v1/order/cancel", methods=["POST"])
@@ -141,20 +222,11 @@ def cancel():
     errors = []
     response = {}
     try:
-        orderbook.cancel_order(order_id)
-        _backup_orderbook(orderbook)
+        was_cancelled = _submit({"command": "cancel", "order_id": order_id}, errors)
         response["order_id"] = order_id
-        response["was_cancelled"] = False
+        response["was_cancelled"] = was_cancelled
         current_time = str(datetime.now())
         response["timestamp"] = current_time
-        try:
-            redis.delete(order_id)
-            _update_redis()
-        except RedisError as err:
-            errors.append({"REDIS_ERROR": str(err)})
-            pass
-        if order_id not in str(redis.keys()):
-            response["was_cancelled"] = True
     except OrderError as err:
         errors.append({"ORDER_ERROR": str(err)})
         pass
@@ -165,8 +237,12 @@ def cancel():
 @app.route("/v1/price/best", methods=["GET"])
 def price():
     response = {}
-    best_ask = orderbook.get_min_ask()
-    best_bid = orderbook.get_max_bid()
+    view = book_views.get(request.args.get("symbol", STOCK_SYMBOL))
+    if view is None:
+        response["errors"] = [{"SYMBOL_ERROR": "Symbol is not listed on this exchange."}]
+        return json.dumps(response)
+    best_ask = view["best_ask"]
+    best_bid = view["best_bid"]
     response["best_ask"] = float(best_ask) if best_ask else 0
     response["best_bid"] = float(best_bid) if best_bid else 0
     current_time = str(datetime.now())
@@ -176,15 +252,27 @@ def price():
 @app.route("/v1/order/book", methods=["GET"])
 def order_book():
     response = {}
-    bids = {}
-    asks = {}
-    bid_volume = [bids.update({str(key): orderbook.bids[key].volume}) for key in orderbook.bids.keys()]
-    ask_volume = [asks.update({str(key): orderbook.asks[key].volume}) for key in orderbook.asks.keys()]
-    response["bids"] = bids
-    response["asks"] = asks
-    current_time = str(datetime.now())
-    response["timestamp"] = current_time
-    return json.dumps(response)
+    symbol = request.args.get("symbol", STOCK_SYMBOL)
+    view = book_views.get(symbol)
+    if view is None:
+        response["errors"] = [{"SYMBOL_ERROR": "Symbol is not listed on this exchange."}]
+        return json.dumps(response)
+    depth = request.args.get("depth", 0, type=int)
+    if depth < 0:
+        response["errors"] = [{"DEPTH_ERROR": "Depth must be a positive number of levels."}]
+        return json.dumps(response)
+    # The journal seq of a view changes whenever its book does, including across restarts.
+    etag = f"{symbol}-{view['seq']}-{depth}"
+    if request.if_none_match.contains(etag):
+        book_response = app.response_class(status=304)
+    else:
+        body = view["responses"].get(depth)
+        if body is None:
+            body = view["responses"][depth] = _render_book(view, depth)
+        current_time = str(datetime.now())
+        book_response = app.response_class(body[:-1] + f', "timestamp": "{current_time}"}}')
+    book_response.set_etag(etag)
+    return book_response
 
 @app.route("/v1/trade/details", methods=["POST"])
 def trade_details():
@@ -192,9 +280,8 @@ def trade_details():
     response = {}
     errors = []
     try:
-        trade = db.trades.find_one({"trade_id": trade_id})
+        trade = _get_trades([trade_id]).get(trade_id)
         if trade:
-            trade.pop("_id", None)
             response["trade"] = trade
         else:
             errors.append({"TRADE_ERROR": "No trade with that trade ID currently exists."})
@@ -205,54 +292,526 @@ def trade_details():
         response["errors"] = errors
     return json.dumps(response)
 
+@app.route("/v1/trade/details/batch", methods=["POST"])
+def trade_details_batch():
+    trade_ids = request.get_json()["trade_ids"]
+    response = {}
+    errors = []
+    try:
+        trades = _get_trades(trade_ids)
+        response["trades"] = [
+            {"trade": trades[trade_id]} if trade_id in trades else
+            {"errors": [{"TRADE_ERROR": "No trade with that trade ID currently exists."}]}
+            for trade_id in trade_ids
+        ]
+    except PyMongoError as err:
+        errors.append({"MONGODB_ERROR": str(err)})
+        pass
+    current_time = str(datetime.now())
+    response["timestamp"] = current_time
+    if errors:
+        response["errors"] = errors
+    return json.dumps(response)
+
+@app.route("/v1/stats/persistence", methods=["GET"])
+def persistence_stats():
+    response = {}
+    response["writer"] = writer.stats()
+    response["completed_cache"] = completed_cache.stats()
+    response["trade_cache"] = trade_cache.stats()
+    response["startup"] = startup_timings
+    response["sequencer"] = sequencer.stats()
+    response["risk"] = risk.stats()
+    current_time = str(datetime.now())
+    response["timestamp"] = current_time
+    return json.dumps(response)
+
 
-def _check_quote(quote):
+def check_quote(quote):
     valid = False
     errors = []
     if quote["side"] != "BUY" and quote["side"] != "SELL":
         errors.append({"SIDE_ERROR": "Incorrect BUY/SELL side format."})
     if quote["order_type"] != "MARKET" and quote["order_type"] != "LIMIT":
         errors.append({"TYPE_ERROR": "Incorrect LIMIT/MARKET side format."})
-    if quote["symbol"] != STOCK_SYMBOL:
+    if quote["symbol"] not in LISTED_SYMBOLS:
         errors.append({"SYMBOL_ERROR": "Incorrect stock symbol for this exchange."})
-    if quote["order_type"] == "LIMIT" and float(quote["price"]) <= 0:
+    if quote["order_type"] == "LIMIT" and quote["price"] <= 0:
         errors.append({"PRICE_ERROR": "Price must be greater than 0."})
+    elif quote["order_type"] == "LIMIT" and TICK_SIZE and quote["price"] % Decimal(str(TICK_SIZE)):
+        errors.append({"PRICE_ERROR": "Price must be a multiple of the tick size."})
+    if len(str(quote["account_id"]).encode()) > ACCOUNT_ID_BYTES:
+        # Snapshots store account IDs in fixed width records, a longer one would stop every snapshot.
+        errors.append({"ACCOUNT_ERROR": f"Account ID must be at most {ACCOUNT_ID_BYTES} bytes."})
     if int(quote["quantity"]) <= 0:
         errors.append({"QUANTITY_ERROR": "Quantity must be greater than 0."})
+    elif int(quote["quantity"]) != Decimal(str(quote["quantity"])):
+        errors.append({"QUANTITY_ERROR": "Quantity must be a whole number."})
     if not errors:
         valid = True
+        quote["quantity"] = int(quote["quantity"])
     return valid, errors
 
-def _setup_orderbook():
-    [redis.delete(key) for key in redis.keys()]
-    orderbook_store = db.orderbook.find({'orderbook_id': 1}).limit(1)
-    if path.isfile(ORDERBOOK_FILE):
-        with open(ORDERBOOK_FILE, 'rb') as f:
+def _validate_only(quote, valid, errors, replaces=None):
+    # The old /v1/quote/verify answer, plus the account's risk limits as they stand right now.
+    if valid:
+        try:
+            sequencer.query(_check_risk, quote, replaces)
+        except RiskError as err:
+            errors.append({"RISK_ERROR": str(err)})
+    response = {}
+    response["valid"] = not errors
+    if errors:
+        response["errors"] = errors
+    current_time = str(datetime.now())
+    response["timestamp"] = current_time
+    return json.dumps(response)
+
+def _check_risk(quote, replaces=None):
+    risk.check(registry.get(quote["symbol"]), quote, replaces, record=False)
+
+def _setup_registry():
+    start = time.perf_counter()
+    seq, snapshot_file = snapshots.latest_file()
+    snapshot = None
+    if snapshot_file is None:
+        seq, snapshot = _load_stored_snapshot()
+    if snapshot_file is not None:
+        try:
+            books = load_snapshot_file(snapshot_file)[1]
+        except SnapshotError:
+            with open(snapshot_file, 'rb') as f:
+                books = _load_pickled_snapshot(f.read())
+    elif snapshot is not None:
+        try:
+            books = load_snapshot(snapshot)[1]
+        except SnapshotError:
+            books = _load_pickled_snapshot(snapshot)
+    else:
+        seq = 0
+        books = [orderbook for orderbook in map(_load_orderbook, LISTED_SYMBOLS) if orderbook]
+    if SHARD_WORKERS:
+        registry = ShardedOrderBookRegistry(LISTED_SYMBOLS, SHARD_WORKERS, SHARD_PINS, TICK_SIZE, PRICE_BAND, books)
+    else:
+        registry = OrderBookRegistry(LISTED_SYMBOLS, TICK_SIZE, PRICE_BAND, books)
+    snapshots.seq = seq
+    journal.advance(seq)
+    startup_timings["snapshot_load_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    replayed = 0
+    for record in journal.read(after_seq=seq):
+        report = apply_command(registry, record)
+        if report:
+            _requeue_fills(report)
+        replayed += 1
+    startup_timings["journal_replay_s"] = time.perf_counter() - start
+    startup_timings["journal_records"] = replayed
+    return registry
+
+def _requeue_fills(report):
+    # The writer's queue dies with the process, so fills replayed from the journal are written again.
+    # They may already be in MongoDB, hence the upsert on their id.
+    for order_id, order in report.completed_orders.items():
+        order = order.to_dict()
+        completed_cache.put(order_id, order)
+        writer.put("orders", dict(order), "order_id")
+    for trade_id, trade in report.trades.items():
+        trade = trade.to_dict()
+        trade_cache.put(trade_id, trade)
+        writer.put("trades", dict(trade), "trade_id")
+
+def _warm_redis(registry):
+    start = time.perf_counter()
+    state = redis.get(REDIS_STATE_KEY)
+    startup_timings["redis_reused"] = state == str(journal.seq)
+    if not startup_timings["redis_reused"]:
+        redis.flushdb()
+        for symbol in LISTED_SYMBOLS:
+            _load_redis(registry.get(symbol))
+        redis.set(REDIS_STATE_KEY, journal.seq)
+    startup_timings["redis_load_s"] = time.perf_counter() - start
+
+def _submit(record, errors):
+    outcome = sequencer.submit(record)
+    if "redis_error" in outcome:
+        errors.append({"REDIS_ERROR": outcome["redis_error"]})
+    if outcome["error"] is not None:
+        raise outcome["error"]
+    return outcome["result"]
+
+def _execute_command(record):
+    return _execute_commands([record])[0]
+
+def _execute_commands(records):
+    # Commands are dispatched without waiting for their reports, so a sharded registry matches a
+    # batch on all of its shards at once. Reports are collected in order at the end, or earlier
+    # when a command depends on one of them.
+    pending = []
+    outcomes = [_dispatch_command(record, pending) for record in records]
+    _collect_reports(pending)
+    return outcomes
+
+def _dispatch_command(record, pending):
+    outcome = {"record": record, "symbol": None, "result": None, "error": None, "journal": False, "report": None}
+    try:
+        orderbook = _command_book(record, pending)
+    except Error as err:
+        outcome["error"] = err
+        return outcome
+    outcome["symbol"] = orderbook.symbol
+    if risk.limited:
+        # Exposure and reference prices have to include every command before this one.
+        _collect_reports(pending)
+    try:
+        risk_errors = _risk_check(orderbook, record)
+    except RiskError as err:
+        outcome["error"] = err
+        return outcome
+    if record["command"] == "batch" and not record["quotes"]:
+        # Every quote was rejected, so there is nothing left to run or journal.
+        outcome["result"] = risk_errors
+        return outcome
+    pending.append((outcome, orderbook, risk_errors, registry.dispatch(orderbook, *command_call(record))))
+    return outcome
+
+def _command_book(record, pending):
+    try:
+        return command_book(registry, record)
+    except OrderError:
+        if not pending:
+            raise
+    # The order may have been placed by a command whose report has not been collected yet.
+    _collect_reports(pending)
+    return command_book(registry, record)
+
+def _collect_reports(pending):
+    for outcome, orderbook, risk_errors, dispatched in pending:
+        record = outcome["record"]
+        try:
+            report = dispatched.result()
+        except Error as err:
+            outcome["error"] = err
+            # A failed edit may already have cancelled the original order, so it is still recorded.
+            report = getattr(err, "report", None)
+        else:
+            if record["command"] == "batch":
+                results = iter(report.results)
+                merged = [error or next(results) for error in risk_errors]
+                outcome["result"] = [order if isinstance(order, Exception) else _order_response(report, order)
+                                     for order in merged]
+            elif record["command"] == "cancel":
+                outcome["result"] = report.changed_orders.get(record["order_id"]) is None
+            else:
+                outcome["result"] = _order_response(report, report.order)
+        if report is not None:
+            outcome["journal"] = True
+            outcome["report"] = report
+            registry.update(orderbook.symbol, report.changed_orders)
+            risk.update(report.changed_orders)
+    del pending[:]
+
+def _risk_check(orderbook, record):
+    # Runs on the matching thread ahead of the engine, so exposure is exact for every order.
+    # Batch quotes that fail are dropped from the record before it is executed and journaled.
+    if record["command"] == "new":
+        risk.check(orderbook, record["quote"])
+    elif record["command"] == "edit":
+        risk.check(orderbook, record["quote"], record["order_id"])
+    elif record["command"] == "batch":
+        errors = risk.check_all(orderbook, record["quotes"])
+        if any(errors):
+            for key in ("quotes", "order_ids", "timestamps"):
+                record[key] = [value for value, error in zip(record[key], errors) if error is None]
+        return errors
+
+def _order_response(report, order):
+    response = order.to_dict()
+    response["was_placed"] = True
+    # changed_orders holds each order's state at the end of the command, None once it left the book.
+    response["was_filled"] = report.changed_orders.get(order.order_id) is None
+    return response
+
+def _commit_batch(outcomes):
+    seq = None
+    changed = {}
+    deltas = {}
+    completed_orders = {}
+    completed_trades = {}
+    for outcome in outcomes:
+        if outcome["journal"]:
+            report = outcome["report"]
+            record = outcome["record"]
+            record["completed_orders"] = list(report.completed_orders)
+            record["trades"] = list(report.trades)
+            seq = journal.append(record, wait=False)
+            changed.setdefault(outcome["symbol"], {}).update(report.changed_orders)
+            completed_orders.update(report.completed_orders)
+            delta = deltas.setdefault(outcome["symbol"], {"bids": {}, "asks": {}, "trades": []})
+            bids, asks = report.levels
+            delta["bids"].update(bids)
+            delta["asks"].update(asks)
+            for trade_id, trade in report.trades.items():
+                completed_trades[trade_id] = trade.to_dict()
+                delta["trades"].append(completed_trades[trade_id])
+    if seq is None:
+        return
+    journal.wait(seq)
+    # Each order is serialized once per batch, in its state at the end of the batch.
+    for order_id, order in completed_orders.items():
+        order = order.to_dict()
+        completed_cache.put(order_id, order)
+        writer.put("orders", dict(order))
+    for trade_id, trade in completed_trades.items():
+        trade_cache.put(trade_id, trade)
+        writer.put("trades", dict(trade))
+    try:
+        _update_redis(changed, seq)
+    except RedisError as err:
+        for outcome in outcomes:
+            outcome["redis_error"] = str(err)
+    for symbol, changed_orders in changed.items():
+        if changed_orders:
+            _publish_book(registry.get(symbol), seq, deltas[symbol])
+    if journal.seq - snapshots.seq >= SNAPSHOT_INTERVAL and not snapshots.busy():
+        _snapshot()
+
+def _publish_book(orderbook, seq, delta=None):
+    # Views are never mutated once published. A delta patches a copy of the previous view's levels
+    # instead of walking the whole book, and bumps the symbol's feed sequence.
+    if delta:
+        previous = book_views[orderbook.symbol]
+        feed_seq = previous["feed_seq"] + 1
+        bids = _patch_levels(previous["bids"], delta["bids"])
+        asks = _patch_levels(previous["asks"], delta["asks"])
+    else:
+        feed_seq = 0
+        bids, asks = orderbook.depth()[:2]
+    book_views[orderbook.symbol] = {
+        "seq": seq,
+        "feed_seq": feed_seq,
+        "best_bid": orderbook.to_price(orderbook.get_max_bid()),
+        "best_ask": orderbook.to_price(orderbook.get_min_ask()),
+        "bids": bids,
+        "asks": asks,
+        "bid_volume": orderbook.bid_volume,
+        "ask_volume": orderbook.ask_volume,
+        "responses": {}
+    }
+    if delta:
+        message = {"type": "delta", "symbol": orderbook.symbol, "seq": feed_seq, "journal_seq": seq,
+                   "bids": {str(price): volume for price, volume in delta["bids"].items()},
+                   "asks": {str(price): volume for price, volume in delta["asks"].items()},
+                   "trades": delta["trades"]}
+        for listener in book_listeners:
+            listener(message)
+
+def _patch_levels(levels, changes):
+    levels = dict(levels)
+    for price, volume in changes.items():
+        if volume:
+            levels[price] = volume
+        else:
+            levels.pop(price, None)
+    return levels
+
+def _render_book(view, depth):
+    bids = heapq.nlargest(depth, view["bids"]) if depth else sorted(view["bids"], reverse=True)
+    asks = heapq.nsmallest(depth, view["asks"]) if depth else sorted(view["asks"])
+    return json.dumps({
+        "bids": {str(price): view["bids"][price] for price in bids},
+        "asks": {str(price): view["asks"][price] for price in asks},
+        "bid_volume": view["bid_volume"],
+        "ask_volume": view["ask_volume"],
+        "seq": view["seq"],
+        "feed_seq": view["feed_seq"]
+    })
+
+def _snapshot():
+    seq = journal.seq
+    # Only the copy is taken on the matching thread, the snapshot writer encodes it.
+    copies = [registry.copy(symbol) for symbol in LISTED_SYMBOLS]
+    journal.rotate()
+    snapshots.submit(seq, lambda: _encode_snapshot(seq, copies))
+
+def _encode_snapshot(seq, copies):
+    # Replay starts after the snapshot, so fills up to seq must have reached MongoDB before it is saved.
+    writer.flush()
+    return dump_snapshot(seq, [registry.encode(book_copy) for book_copy in copies])
+
+def _store_snapshot(seq, snapshot):
+    journal.prune(seq)
+    try:
+        snapshot_store = gridfs.GridFS(db, collection="snapshots")
+        snapshot_store.put(snapshot, filename="orderbook", seq=seq)
+        for stored in snapshot_store.find({"filename": "orderbook", "seq": {"$lt": seq}}):
+            snapshot_store.delete(stored._id)
+    except PyMongoError:
+        pass
+
+def _load_stored_snapshot():
+    seq, snapshot = None, None
+    try:
+        stored = gridfs.GridFS(db, collection="snapshots").find_one({"filename": "orderbook"}, sort=[("seq", -1)])
+        if stored:
+            seq, snapshot = stored.seq, stored.read()
+    except PyMongoError:
+        pass
+    return seq, snapshot
+
+def _load_pickled_snapshot(snapshot):
+    snapshot = pickle.loads(snapshot)
+    return [pickle.loads(orderbook) for orderbook in snapshot["books"].values()]
+
+def _load_orderbook(symbol):
+    orderbook = None
+    orderbook_file = ORDERBOOK_FILE.format(symbol=symbol)
+    orderbook_store = db.orderbook.find({'symbol': symbol}).limit(1)
+    if symbol == STOCK_SYMBOL and path.isfile(LEGACY_ORDERBOOK_FILE) and not path.isfile(orderbook_file):
+        orderbook_file = LEGACY_ORDERBOOK_FILE
+    if symbol == STOCK_SYMBOL and orderbook_store.count() == 0:
+        # Single-book releases stored the book under orderbook_id 1, often its only durable copy.
+        orderbook_store = db.orderbook.find({'orderbook_id': 1}).limit(1)
+    if path.isfile(orderbook_file):
+        with open(orderbook_file, 'rb') as f:
             orderbook = pickle.load(f)
     elif orderbook_store.count() > 0:
         orderbook = pickle.loads(orderbook_store[0]["orderbook"])
-    else:
-        orderbook = OrderBook(STOCK_SYMBOL)
     return orderbook
 
-def _update_redis():
-    for ids, orders in orderbook.ongoing_orders.items():
-        redis.set(ids, orders)
-    if hasattr(orderbook, 'completed_orders'):
-        for ids, orders in orderbook.completed_orders.items():
-            db.orders.insert_one(json.loads(orders))
-            redis.delete(ids)
-    if hasattr(orderbook, 'completed_trades'):
-        for trades in orderbook.completed_trades.values():
-            db.trades.insert_one(json.loads(trades))
-
-def _backup_orderbook(orderbook):
-    with open(ORDERBOOK_FILE, 'wb') as f:
-        pickle.dump(orderbook, f)
-    orderbook_string = pickle.dumps(orderbook)
-    db.orderbook.replace_one({'orderbook_id': 1}, {'orderbook_id': 1, 'orderbook': Binary(orderbook_string)}, upsert=True)
+def _load_redis(orderbook):
+    orders_key = ORDERS_KEY.format(symbol=orderbook.symbol)
+    orders = list(orderbook.orders.values())
+    for i in range(0, len(orders), REDIS_LOAD_BATCH):
+        batch = {order.order_id: order.json() for order in orders[i:i + REDIS_LOAD_BATCH]}
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.hmset(orders_key, batch)
+        pipeline.hmset(ORDER_SYMBOLS_KEY, dict.fromkeys(batch, orderbook.symbol))
+        pipeline.execute()
+
+def _find_resting_orders(order_ids):
+    orders = {}
+    for order_id in order_ids:
+        try:
+            order = registry.find(order_id).get_order(order_id)
+        except OrderError:
+            continue
+        orders[order_id] = order.to_dict()
+    return orders
+
+def _get_orders(order_ids):
+    orders = {}
+    unresolved = []
+    for order_id in order_ids:
+        order = completed_cache.get(order_id)
+        if order is not None:
+            order = dict(order)
+            order["was_placed"] = True
+            order["was_filled"] = True
+            orders[order_id] = order
+        else:
+            unresolved.append(order_id)
+    missing = []
+    if unresolved:
+        resting_orders = sequencer.query(_find_resting_orders, unresolved)
+        for order_id in unresolved:
+            order = resting_orders.get(order_id)
+            if order is not None:
+                order["was_placed"] = True
+                order["was_filled"] = False
+                orders[order_id] = order
+            else:
+                missing.append(order_id)
+    if missing:
+        _flush_writer()
+        for order in db.orders.find({"order_id": {"$in": missing}}, {"_id": 0}):
+            order["was_placed"] = True
+            order["was_filled"] = True
+            orders[order["order_id"]] = order
+    return orders
+
+def _get_trades(trade_ids):
+    trades = {}
+    missing = []
+    for trade_id in trade_ids:
+        trade = trade_cache.get(trade_id)
+        if trade is not None:
+            trades[trade_id] = dict(trade)
+        else:
+            missing.append(trade_id)
+    if missing:
+        _flush_writer()
+        for trade in db.trades.find({"trade_id": {"$in": missing}}, {"_id": 0}):
+            trades[trade["trade_id"]] = trade
+    return trades
+
+def _flush_writer():
+    # The writer retries until MongoDB takes the batch, so a lookup gives up instead of waiting on it.
+    if not writer.flush(WRITER_FLUSH_TIMEOUT):
+        raise PyMongoError("Timed out waiting for queued writes to reach MongoDB.")
+
+def _create_indexes():
+    try:
+        db.orders.create_index("order_id")
+        db.trades.create_index("trade_id")
+    except PyMongoError:
+        pass
+
+def _update_redis(changed, seq=None):
+    global redis_dirty
+    pipeline = redis.pipeline()
+    for symbol, changed_orders in changed.items():
+        updated = {order_id: order.json() for order_id, order in changed_orders.items() if order is not None}
+        removed = [order_id for order_id, order in changed_orders.items() if order is None]
+        orders_key = ORDERS_KEY.format(symbol=symbol)
+        if updated:
+            pipeline.hmset(orders_key, updated)
+            pipeline.hmset(ORDER_SYMBOLS_KEY, dict.fromkeys(updated, symbol))
+        if removed:
+            pipeline.hdel(orders_key, *removed)
+            pipeline.hdel(ORDER_SYMBOLS_KEY, *removed)
+    # The state key tells the next startup that Redis already matches the journal. Once a
+    # delta has been lost it can never be trusted again, so keep it deleted from then on.
+    if redis_dirty or seq is None:
+        pipeline.delete(REDIS_STATE_KEY)
+    else:
+        pipeline.set(REDIS_STATE_KEY, seq)
+    try:
+        pipeline.execute()
+    except RedisError:
+        redis_dirty = True
+        raise
+
+def _shutdown():
+    atexit.unregister(_shutdown)
+    if sequencer is not None:
+        sequencer.close()
+    snapshots.wait()
+    journal.close()
+    writer.close()
+
+def _terminate(signum, frame):
+    # docker stop sends SIGTERM, which skips atexit handlers unless the process exits on its own.
+    _shutdown()
+    sys.exit(0)
+
+def start():
+    global journal, writer, snapshots, registry, sequencer, risk
+    journal = Journal(JOURNAL_DIR)
+    writer = BulkWriter(db)
+    _create_indexes()
+    snapshots = SnapshotWriter(JOURNAL_DIR, _store_snapshot)
+    atexit.register(_shutdown)
+    signal.signal(signal.SIGTERM, _terminate)
+    registry = _setup_registry()
+    _warm_redis(registry)
+    risk = RiskEngine(RISK_LIMITS, ACCOUNT_RISK_LIMITS)
+    for symbol in LISTED_SYMBOLS:
+        risk.load(registry.get(symbol).orders.values())
+    for symbol in LISTED_SYMBOLS:
+        _publish_book(registry.get(symbol), journal.seq)
+    sequencer = Sequencer(_execute_command, _commit_batch, SEQUENCER_BATCH, _execute_commands)
+    print_results("Startup", startup_timings, 3)
 
 if __name__ == "__main__":
-    orderbook = _setup_orderbook()
-    _update_redis()
+    start()
     app.run(host='0.0.0.0', port=5000, debug=True)
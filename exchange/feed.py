@@ -0,0 +1,129 @@
+import asyncio
+import json
+import threading
+
+
+FEED_PORT = 5002
+MAX_BUFFER = 1 << 20
+
+
+class MarketDataFeed(object):
+
+    def __init__(self, views, max_buffer=MAX_BUFFER):
+        self.views = views
+        self.max_buffer = max_buffer
+        self.loop = None
+        self.subscribers = {}
+        self.pending = []
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.flushes = 0
+        self.resyncs = 0
+
+    async def serve(self, host="0.0.0.0", port=FEED_PORT):
+        self.loop = asyncio.get_running_loop()
+        return await asyncio.start_server(self._session, host, port)
+
+    def publish(self, delta):
+        # Called from the matching thread: queue the delta for the loop and return straight away.
+        # Deltas that pile up while the loop is busy go out together, one write per subscriber.
+        if self.loop is None:
+            return
+        with self.lock:
+            self.pending.append(delta)
+            first = len(self.pending) == 1
+        if first:
+            self.loop.call_soon_threadsafe(self._broadcast)
+
+    def snapshot(self, symbol):
+        view = self.views[symbol]
+        return {
+            "type": "snapshot",
+            "symbol": symbol,
+            "seq": view["feed_seq"],
+            "journal_seq": view["seq"],
+            "bids": {str(price): volume for price, volume in view["bids"].items()},
+            "asks": {str(price): volume for price, volume in view["asks"].items()}
+        }
+
+    def stats(self):
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self.subscribers.values()),
+            "messages": self.messages,
+            "flushes": self.flushes,
+            "resyncs": self.resyncs
+        }
+
+    def _broadcast(self):
+        with self.lock:
+            deltas, self.pending = self.pending, []
+        self.messages += len(deltas)
+        self.flushes += 1
+        lines = {}
+        for delta in deltas:
+            if self.subscribers.get(delta["symbol"]):
+                lines.setdefault(delta["symbol"], []).append(_encode(delta))
+        for symbol, symbol_lines in lines.items():
+            data = b"".join(symbol_lines)
+            for subscriber in list(self.subscribers[symbol]):
+                subscriber.deliver(symbol, data)
+
+    async def _session(self, reader, writer):
+        subscriber = _Subscriber(self, writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    writer.write(_encode({"type": "error", "error": "REQUEST_ERROR",
+                                          "reason": "Requests must be JSON lines."}))
+                    continue
+                for symbol in request.get("subscribe", ()):
+                    if self._check_symbol(writer, symbol):
+                        self.subscribers.setdefault(symbol, set()).add(subscriber)
+                        writer.write(_encode(self.snapshot(symbol)))
+                for symbol in request.get("unsubscribe", ()):
+                    self.subscribers.get(symbol, set()).discard(subscriber)
+                if "snapshot" in request and self._check_symbol(writer, request["snapshot"]):
+                    writer.write(_encode(self.snapshot(request["snapshot"])))
+        except ConnectionError:
+            pass
+        finally:
+            for subscribers in self.subscribers.values():
+                subscribers.discard(subscriber)
+            writer.close()
+
+    def _check_symbol(self, writer, symbol):
+        if symbol in self.views:
+            return True
+        writer.write(_encode({"type": "error", "error": "SYMBOL_ERROR",
+                              "reason": "Symbol is not listed on this exchange.", "symbol": symbol}))
+        return False
+
+class _Subscriber(object):
+
+    def __init__(self, feed, writer):
+        self.feed = feed
+        self.writer = writer
+        self.stale = set()
+
+    def deliver(self, symbol, data):
+        # A subscriber that cannot keep up stops receiving deltas instead of buffering without
+        # bound. Once its socket drains it is sent a fresh snapshot and carries on from there.
+        buffered = self.writer.transport.get_write_buffer_size()
+        if symbol in self.stale:
+            if buffered > self.feed.max_buffer // 2:
+                return
+            self.stale.discard(symbol)
+            self.feed.resyncs += 1
+            data = _encode(self.feed.snapshot(symbol))
+        elif buffered > self.feed.max_buffer:
+            self.stale.add(symbol)
+            return
+        self.writer.write(data)
+
+def _encode(message):
+    return (json.dumps(message) + "\n").encode()
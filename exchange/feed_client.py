@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import json
+import socket
+import time
+
+from results import report_results
+
+
+class FeedClient(object):
+
+    def __init__(self, host="localhost", port=5002):
+        self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile("rb")
+        self.books = {}
+        self.gaps = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def subscribe(self, *symbols):
+        self._send({"subscribe": list(symbols)})
+
+    def unsubscribe(self, *symbols):
+        self._send({"unsubscribe": list(symbols)})
+
+    def request_snapshot(self, symbol):
+        self._send({"snapshot": symbol})
+
+    def receive(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Feed closed the connection.")
+        message = json.loads(line)
+        self._apply(message)
+        return message
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def _send(self, request):
+        self.socket.sendall((json.dumps(request) + "\n").encode())
+
+    def _apply(self, message):
+        if message["type"] == "snapshot":
+            self.books[message["symbol"]] = {"seq": message["seq"], "bids": message["bids"], "asks": message["asks"]}
+            return
+        if message["type"] != "delta":
+            return
+        book = self.books.get(message["symbol"])
+        # Until a snapshot arrives, and for deltas it already includes, there is nothing to apply.
+        if book is None or book["seq"] is None or message["seq"] <= book["seq"]:
+            return
+        if message["seq"] != book["seq"] + 1:
+            self.gaps += 1
+            book["seq"] = None
+            self.request_snapshot(message["symbol"])
+            return
+        book["seq"] = message["seq"]
+        for side in ("bids", "asks"):
+            levels = book[side]
+            for price, volume in message[side].items():
+                if volume:
+                    levels[price] = volume
+                else:
+                    levels.pop(price, None)
+
+
+async def _subscriber(host, port, symbol, deadline, counters):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((json.dumps({"subscribe": [symbol]}) + "\n").encode())
+    seq = None
+    try:
+        while time.perf_counter() < deadline:
+            try:
+                line = await asyncio.wait_for(reader.readline(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                break
+            if not line:
+                break
+            message = json.loads(line)
+            if message["type"] == "snapshot":
+                counters["snapshots"] += 1
+                seq = message["seq"]
+            elif message["type"] == "delta" and seq is not None and message["seq"] > seq:
+                counters["deltas"] += 1
+                counters["gaps"] += message["seq"] != seq + 1
+                seq = message["seq"]
+    finally:
+        writer.close()
+
+async def _subscribe_all(host, port, symbol, subscribers, duration):
+    counters = {"snapshots": 0, "deltas": 0, "gaps": 0}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[_subscriber(host, port, symbol, deadline, counters) for _ in range(subscribers)])
+    return counters
+
+def bench_subscribers(host="localhost", port=5002, symbol="KEQ", subscribers=100, duration=10.0):
+    results = asyncio.run(_subscribe_all(host, port, symbol, subscribers, duration))
+    results["subscribers"] = subscribers
+    results["deltas_per_subscriber"] = results["deltas"] / subscribers if subscribers else 0.0
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Hold many market data subscriptions open against a running "
+                                                 "feed and check every stream stays in sequence.")
+    parser.add_argument("--feed", default="localhost:5002", help="feed host:port")
+    parser.add_argument("--symbol", default="KEQ")
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to stay subscribed")
+    parser.add_argument("--output", help="append results as JSON lines to this file")
+    args = parser.parse_args()
+    host, _, port = args.feed.rpartition(":")
+    results = bench_subscribers(host, int(port), args.symbol, args.subscribers, args.duration)
+    report_results("feed", results, args.output)
+
+if __name__ == "__main__":
+    main()
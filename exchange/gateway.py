@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+from datetime import datetime
+import struct
+import uuid
+
+import async_server
+import exchange
+from feed import FEED_PORT, MarketDataFeed
+from orderbook import from_ticks
+from protocol import CANCEL_ORDER, FRAME_HEADER, MODIFY_ORDER, NEW_ORDER
+from protocol import STATUS_CANCELLED, STATUS_FILLED, STATUS_RESTING
+from protocol import ProtocolError, decode, encode_execution_report, encode_price, encode_reject
+from sequencer import SequencerError
+
+
+GATEWAY_PORT = 5001
+CLIENT_MESSAGES = (NEW_ORDER, CANCEL_ORDER, MODIFY_ORDER)
+
+
+async def serve_gateway(host="0.0.0.0", port=GATEWAY_PORT, path=None):
+    if path is not None:
+        return await asyncio.start_unix_server(_session, path)
+    return await asyncio.start_server(_session, host, port)
+
+async def _session(reader, writer):
+    pending = asyncio.Queue()
+    replies = asyncio.ensure_future(_reply_loop(pending, writer))
+    try:
+        while True:
+            length, message_type = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+            body = await reader.readexactly(length - 1) if length > 1 else b""
+            try:
+                item = _dispatch(message_type, body)
+            except Exception as err:
+                item = encode_reject(0, "INTERNAL_ERROR", str(err))
+            pending.put_nowait(item)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        pending.put_nowait(None)
+        try:
+            await replies
+        finally:
+            writer.close()
+
+def _dispatch(message_type, body):
+    # Commands are queued to the sequencer in arrival order; replies are written in the same order.
+    if message_type not in CLIENT_MESSAGES:
+        return encode_reject(0, "PROTOCOL_ERROR", f"Unexpected message type {message_type!r}.")
+    try:
+        message = decode(message_type, body)
+    except (struct.error, ProtocolError, UnicodeDecodeError):
+        return encode_reject(0, "PROTOCOL_ERROR", "Malformed message.")
+    client_ref = message["client_ref"]
+    if message_type == CANCEL_ORDER:
+        record = {"command": "cancel", "order_id": message["order_id"]}
+    else:
+        valid, errors = exchange.check_quote(message["quote"])
+        if not valid:
+            error, reason = next(iter(errors[0].items()))
+            return encode_reject(client_ref, error, reason)
+        if message_type == NEW_ORDER:
+            record = {"command": "new", "quote": message["quote"], "order_id": str(uuid.uuid4()),
+                      "timestamp": datetime.now()}
+        else:
+            record = {"command": "edit", "order_id": message["order_id"], "quote": message["quote"],
+                      "new_order_id": str(uuid.uuid4()), "timestamp": datetime.now()}
+    try:
+        return client_ref, record, exchange.sequencer.submit_async(record)
+    except SequencerError as err:
+        return encode_reject(client_ref, "ORDER_ERROR", str(err))
+
+async def _reply_loop(pending, writer):
+    while True:
+        item = await pending.get()
+        if item is None:
+            return
+        if isinstance(item, tuple):
+            client_ref, record, future = item
+            try:
+                item = _report(client_ref, record, await future)
+            except SequencerError as err:
+                item = encode_reject(client_ref, "ORDER_ERROR", str(err))
+            except Exception as err:
+                # One failed command must not stop the replies to everything queued behind it.
+                item = encode_reject(client_ref, "INTERNAL_ERROR", str(err))
+        writer.write(item)
+        if pending.empty():
+            try:
+                await writer.drain()
+            except ConnectionError:
+                return
+
+def _report(client_ref, record, outcome):
+    error = outcome["error"]
+    if error is not None:
+        return encode_reject(client_ref, exchange.ENGINE_ERRORS.get(type(error), "ORDER_ERROR"), str(error))
+    if record["command"] == "cancel":
+        return encode_execution_report(client_ref, STATUS_CANCELLED, record["order_id"], 0, 0, 0)
+    order = outcome["result"]
+    fills = [(execution.trade.trade_id, encode_price(from_ticks(execution.price, execution.order.tick_size)),
+              int(execution.quantity))
+             for execution in outcome["report"].fills()]
+    return encode_execution_report(client_ref, STATUS_FILLED if order["was_filled"] else STATUS_RESTING,
+                                   order["order_id"], encode_price(order["price"]), int(order["initial_quantity"]),
+                                   int(order["quantity"]), fills)
+
+async def _run(host, port, path, http_port, feed_port):
+    servers = [await serve_gateway(host, port, path)]
+    if http_port:
+        servers.append(await async_server.serve(async_server.app, host, http_port))
+    if feed_port:
+        feed = MarketDataFeed(exchange.book_views)
+        exchange.book_listeners.append(feed.publish)
+        servers.append(await feed.serve(host, feed_port))
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the binary order entry gateway next to the JSON HTTP API "
+                                                 "and the market data feed. Both order paths feed the same "
+                                                 "sequencer.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=GATEWAY_PORT, help="gateway TCP port")
+    parser.add_argument("--unix-socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--http-port", type=int, default=5000, help="JSON HTTP API port (0 disables it)")
+    parser.add_argument("--feed-port", type=int, default=FEED_PORT, help="market data feed port (0 disables it)")
+    args = parser.parse_args()
+    exchange.start()
+    asyncio.run(_run(args.host, args.port, args.unix_socket, args.http_port, args.feed_port))
+
+if __name__ == "__main__":
+    main()
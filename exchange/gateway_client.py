@@ -0,0 +1,176 @@
+import argparse
+import http.client
+import json
+import socket
+import time
+from urllib.parse import urlsplit
+
+from benchmark import _percentile, random_quotes
+from protocol import FRAME_HEADER, REJECT
+from protocol import decode, encode_cancel_order, encode_modify_order, encode_new_order
+from results import report_results
+
+
+class GatewayClient(object):
+
+    def __init__(self, host="localhost", port=5001, path=None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = bytearray()
+        self.next_ref = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def new_order(self, quote):
+        return self.wait(self.send_new_order(quote))
+
+    def cancel_order(self, order_id):
+        return self.wait(self.send_cancel_order(order_id))
+
+    def modify_order(self, order_id, quote):
+        return self.wait(self.send_modify_order(order_id, quote))
+
+    def send_new_order(self, quote):
+        return self._send(encode_new_order, quote)
+
+    def send_cancel_order(self, order_id):
+        return self._send(encode_cancel_order, order_id)
+
+    def send_modify_order(self, order_id, quote):
+        return self._send(encode_modify_order, order_id, quote)
+
+    def receive(self):
+        length, message_type = FRAME_HEADER.unpack(self._read(FRAME_HEADER.size))
+        report = decode(message_type, self._read(length - 1))
+        if message_type == REJECT:
+            raise GatewayReject(report["client_ref"], report["error"], report["reason"])
+        return report
+
+    def wait(self, client_ref):
+        while True:
+            report = self.receive()
+            if report["client_ref"] == client_ref:
+                return report
+
+    def close(self):
+        self.socket.close()
+
+    def _send(self, encode, *args):
+        client_ref = self.next_ref
+        self.next_ref += 1
+        self.socket.sendall(encode(client_ref, *args))
+        return client_ref
+
+    def _read(self, size):
+        while len(self.buffer) < size:
+            chunk = self.socket.recv(65536)
+            if not chunk:
+                raise ConnectionError("Gateway closed the connection.")
+            self.buffer += chunk
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+class GatewayReject(Exception):
+
+    def __init__(self, client_ref, error, reason):
+        super().__init__(f"{error}: {reason}")
+        self.client_ref = client_ref
+        self.error = error
+        self.reason = reason
+
+
+def _summary(samples, elapsed):
+    samples.sort()
+    return {
+        "orders": len(samples),
+        "orders_per_sec": len(samples) / elapsed if elapsed else 0.0,
+        "p50_us": _percentile(samples, 0.5) * 1e6,
+        "p99_us": _percentile(samples, 0.99) * 1e6,
+        "p999_us": _percentile(samples, 0.999) * 1e6
+    }
+
+def bench_gateway(host="localhost", port=5001, path=None, orders=2000, window=1, seed=1):
+    quotes = list(random_quotes(orders, market_ratio=0.2, seed=seed))
+    samples = []
+    rejects = 0
+    with GatewayClient(host, port, path) as client:
+        sent = {}
+        start = time.perf_counter()
+        for quote in quotes:
+            sent[client.send_new_order(quote)] = time.perf_counter()
+            while len(sent) >= window:
+                rejects += _receive_sample(client, sent, samples)
+        while sent:
+            rejects += _receive_sample(client, sent, samples)
+        elapsed = time.perf_counter() - start
+    results = _summary(samples, elapsed)
+    results["rejects"] = rejects
+    return results
+
+def _receive_sample(client, sent, samples):
+    try:
+        client_ref = client.receive()["client_ref"]
+        rejected = 0
+    except GatewayReject as reject:
+        client_ref = reject.client_ref
+        rejected = 1
+    samples.append(time.perf_counter() - sent.pop(client_ref))
+    return rejected
+
+def bench_http(url="http://localhost:5000", orders=2000, seed=1):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    connection.connect()
+    connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    samples = []
+    rejects = 0
+    start = time.perf_counter()
+    for quote in random_quotes(orders, market_ratio=0.2, seed=seed):
+        if quote["price"] is None:
+            del quote["price"]
+        else:
+            quote["price"] = str(quote["price"])
+        sent = time.perf_counter()
+        connection.request("POST", "/v1/order/new", json.dumps({"quote": quote}),
+                           {"Content-Type": "application/json"})
+        response = json.loads(connection.getresponse().read())
+        samples.append(time.perf_counter() - sent)
+        rejects += "errors" in response
+    elapsed = time.perf_counter() - start
+    connection.close()
+    results = _summary(samples, elapsed)
+    results["rejects"] = rejects
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Order entry latency: binary gateway against the JSON HTTP API "
+                                                 "of a running exchange.")
+    parser.add_argument("--gateway", default="localhost:5001", help="gateway host:port")
+    parser.add_argument("--unix-socket", help="connect to the gateway over this Unix socket")
+    parser.add_argument("--url", default="http://localhost:5000", help="HTTP API to compare against "
+                                                                      "(empty to skip)")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--window", type=int, default=1, help="gateway orders in flight (1 measures round trips)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="append results as JSON lines to this file")
+    args = parser.parse_args()
+    host, _, port = args.gateway.rpartition(":")
+    runs = [("gateway", lambda: bench_gateway(host, int(port), args.unix_socket, args.orders, args.window,
+                                              args.seed))]
+    if args.url:
+        runs.append(("http", lambda: bench_http(args.url, args.orders, args.seed)))
+    for name, run in runs:
+        results = run()
+        report_results(name, results, args.output, path=name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import glob
+import json
+import os
+import threading
+
+
+SEGMENT_FILE = "journal-{seq:012d}.log"
+SNAPSHOT_FILE = "snapshot-{seq:012d}.bin"
+
+
+class Journal(object):
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.seq = 0
+        for record in self.read():
+            self.seq = record["seq"]
+        self.flushed_seq = self.seq
+        self.pending = []
+        self.rotate_requested = True
+        self.segment = None
+        self.closed = False
+        self.condition = threading.Condition()
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "journal-*.log")))
+
+    def read(self, after_seq=0):
+        for segment in self.segments():
+            with open(segment, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record["seq"] > after_seq:
+                        yield record
+
+    def append(self, record, wait=True):
+        with self.condition:
+            if self.closed:
+                raise JournalError("Journal has been closed.")
+            self.seq += 1
+            seq = self.seq
+            record["seq"] = seq
+            self.pending.append(json.dumps(record, default=str))
+            self.condition.notify_all()
+        if wait:
+            self.wait(seq)
+        return seq
+
+    def wait(self, seq):
+        with self.condition:
+            while self.flushed_seq < seq:
+                self.condition.wait()
+
+    def advance(self, seq):
+        # A snapshot can outlive the segments it covers, so numbering resumes after it.
+        with self.condition:
+            self.seq = max(self.seq, seq)
+            self.flushed_seq = max(self.flushed_seq, seq)
+
+    def rotate(self):
+        with self.condition:
+            self.rotate_requested = True
+
+    def prune(self, seq):
+        segments = self.segments()
+        for segment, next_segment in zip(segments, segments[1:]):
+            if _segment_seq(next_segment) <= seq + 1:
+                os.remove(segment)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.flusher.join()
+        if self.segment:
+            self.segment.close()
+
+    def _flush_loop(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                batch, self.pending = self.pending, []
+                last_seq = self.seq
+                rotate, self.rotate_requested = self.rotate_requested, False
+            if rotate or self.segment is None:
+                if self.segment:
+                    self.segment.close()
+                first_seq = last_seq - len(batch) + 1
+                self.segment = open(os.path.join(self.directory, SEGMENT_FILE.format(seq=first_seq)), "ab")
+            self.segment.write(("\n".join(batch) + "\n").encode())
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+            with self.condition:
+                self.flushed_seq = last_seq
+                self.condition.notify_all()
+
+class SnapshotWriter(object):
+
+    def __init__(self, directory, on_saved=None, keep=2):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.on_saved = on_saved
+        self.keep = keep
+        self.seq = 0
+        self.thread = None
+
+    def latest(self):
+        seq, snapshot_file = self.latest_file()
+        if snapshot_file is None:
+            return None, None
+        with open(snapshot_file, "rb") as f:
+            return seq, f.read()
+
+    def latest_file(self):
+        snapshots = sorted(glob.glob(os.path.join(self.directory, "snapshot-*.bin")))
+        if not snapshots:
+            return None, None
+        return _segment_seq(snapshots[-1]), snapshots[-1]
+
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def submit(self, seq, data):
+        self.seq = seq
+        self.thread = threading.Thread(target=self._write, args=(seq, data), daemon=True)
+        self.thread.start()
+
+    def wait(self):
+        if self.thread:
+            self.thread.join()
+
+    def _write(self, seq, data):
+        if callable(data):
+            data = data()
+        snapshot_file = os.path.join(self.directory, SNAPSHOT_FILE.format(seq=seq))
+        with open(snapshot_file + ".tmp", "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(snapshot_file + ".tmp", snapshot_file)
+        for snapshot in sorted(glob.glob(os.path.join(self.directory, "snapshot-*.bin")))[:-self.keep]:
+            os.remove(snapshot)
+        if self.on_saved:
+            self.on_saved(seq, data)
+
+def _segment_seq(file_name):
+    return int(os.path.basename(file_name).split("-")[1].split(".")[0])
+
+class JournalError(Exception):
+    pass
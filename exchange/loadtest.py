@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from benchmark import _percentile, random_quotes
+from results import report_results
+
+
+ROUTES = {
+    "new": ("POST", "/v1/order/new"),
+    "price": ("GET", "/v1/price/best"),
+    "book": ("GET", "/v1/order/book")
+}
+
+
+def _requests(route, count, seed):
+    method, path = ROUTES[route]
+    if route != "new":
+        for _ in range(count):
+            yield method, path, b""
+        return
+    for quote in random_quotes(count, market_ratio=0.2, seed=seed):
+        if quote["price"] is None:
+            del quote["price"]
+        else:
+            quote["price"] = str(quote["price"])
+        yield method, path, json.dumps({"quote": quote}).encode()
+
+async def _client(host, port, pending, latencies, counters):
+    reader = writer = None
+    try:
+        for method, path, body in pending:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write((f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+            head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").lower()
+            length = 0
+            for line in head.split("\r\n"):
+                if line.startswith("content-length:"):
+                    length = int(line.partition(":")[2])
+            if length:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if not head.startswith("http/1.1 200") and not head.startswith("http/1.0 200"):
+                counters["errors"] += 1
+            # Servers speaking HTTP/1.0 or closing the connection force a reconnect for the next request.
+            if head.startswith("http/1.0") or "connection: close" in head or "content-length:" not in head:
+                writer.close()
+                reader = writer = None
+                counters["reconnects"] += 1
+    except (ConnectionError, OSError, asyncio.IncompleteReadError):
+        counters["errors"] += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+async def _load(url, route, connections, requests, seed):
+    parts = urlsplit(url)
+    pending = _requests(route, requests, seed)
+    latencies = []
+    counters = {"errors": 0, "reconnects": 0}
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(parts.hostname, parts.port or 80, pending, latencies, counters)
+                           for _ in range(connections)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "url": url,
+        "route": route,
+        "connections": connections,
+        "requests": len(latencies),
+        "errors": counters["errors"],
+        "reconnects": counters["reconnects"],
+        "elapsed_s": elapsed,
+        "requests_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 0.5) * 1e3 if latencies else 0.0,
+        "p99_ms": _percentile(latencies, 0.99) * 1e3 if latencies else 0.0,
+        "p999_ms": _percentile(latencies, 0.999) * 1e3 if latencies else 0.0
+    }
+
+def run_load(url, route="new", connections=100, requests=10000, seed=1):
+    return asyncio.run(_load(url, route, connections, requests, seed))
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a running exchange server over keep-alive HTTP "
+                                                 "connections. Pass several --url options to compare the "
+                                                 "Flask server (exchange.py) with async_server.py.")
+    parser.add_argument("--url", action="append", help="server to load (default: http://localhost:5000)")
+    parser.add_argument("--route", choices=sorted(ROUTES), action="append", help="route to load (default: new)")
+    parser.add_argument("--connections", type=int, default=100, help="concurrent client connections")
+    parser.add_argument("--requests", type=int, default=10000, help="requests per route")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="append results as JSON lines to this file")
+    args = parser.parse_args()
+    for url in args.url or ["http://localhost:5000"]:
+        for route in args.route or ["new"]:
+            results = run_load(url, route, args.connections, args.requests, args.seed)
+            report_results("load", results, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,41 @@
+from bisect import bisect_left, insort
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal
 import json
 import uuid
 
 
+TRADE_ID_NAMESPACE = uuid.UUID("6b4f0f52-4c1e-4f8e-9a53-2d9b1e3c7a10")
+REST = "REST"
+FILL = "FILL"
+CANCEL = "CANCEL"
+
+def to_ticks(price, tick_size):
+    ticks, remainder = divmod(Decimal(str(price)), tick_size)
+    if remainder:
+        raise PriceError("Price must be a multiple of the tick size.")
+    return int(ticks)
+
+def from_ticks(ticks, tick_size):
+    price = ticks
+    if tick_size is not None and ticks is not None:
+        price = ticks * tick_size
+    return price
+
+def _restore_slots(instance, state):
+    if isinstance(state, tuple):
+        state = state[1]
+    for key, value in state.items():
+        setattr(instance, key, value)
+
 class Order(object):
 
-    def __init__(self, quote):
-        self.order_id = str(uuid.uuid4())
+    __slots__ = ("order_id", "account_id", "side", "order_type", "symbol", "price",
+                 "timestamp", "initial_quantity", "quantity", "trades", "tick_size")
+
+    def __init__(self, quote, tick_size=None, order_id=None, timestamp=None):
+        self.order_id = order_id or str(uuid.uuid4())
         self.account_id = quote["account_id"]
         self.side = quote["side"]
         self.order_type = quote["order_type"]
@@ -15,47 +43,61 @@ class Order(object):
         self.price = None
         if self.order_type == "LIMIT":
             self.price = quote["price"]
-        self.timestamp = datetime.now()
+            if tick_size is not None:
+                self.price = to_ticks(quote["price"], tick_size)
+        self.timestamp = timestamp or datetime.now()
         self.initial_quantity = quote["quantity"]
         self.quantity = quote["quantity"]
         self.trades = []
+        self.tick_size = tick_size
 
-    def json(self):
+    def to_dict(self):
         response = {
             "order_id": self.order_id,
             "account_id": self.account_id,
             "side": self.side,
             "order_type": self.order_type,
             "symbol": self.symbol,
-            "price": str(self.price),
+            "price": str(from_ticks(self.price, self.tick_size)),
             "timestamp": str(self.timestamp),
             "initial_quantity": str(self.initial_quantity),
             "quantity": str(self.quantity),
             "trades": [str(trades) for trades in self.trades]
         }
-        return json.dumps(response)
+        return response
+
+    def json(self):
+        return json.dumps(self.to_dict())
 
     def update(self, quantity):
         self.quantity = quantity
 
+    def __setstate__(self, state):
+        self.tick_size = None
+        _restore_slots(self, state)
+
     def __repr__(self):
         order_string = f"{self.side} - {self.initial_quantity} {self.symbol} @ MARKET"
         if self.price:
-            order_string = f"{self.side} - {self.initial_quantity} {self.symbol} @ {self.price}"
+            price = from_ticks(self.price, self.tick_size)
+            order_string = f"{self.side} - {self.initial_quantity} {self.symbol} @ {price}"
         return order_string
 
 class Trade(object):
 
+    __slots__ = ("trade_id", "existing_order", "incoming_order", "timestamp", "price",
+                 "symbol", "quantity")
+
     def __init__(self, existing_order, incoming_order, quantity):
-        self.trade_id = str(uuid.uuid4())
+        self.trade_id = str(uuid.uuid5(TRADE_ID_NAMESPACE, f"{existing_order.order_id}:{incoming_order.order_id}"))
         self.existing_order = existing_order
         self.incoming_order = incoming_order
-        self.timestamp = datetime.now()
+        self.timestamp = incoming_order.timestamp
         self.price = self.existing_order.price
         self.symbol = self.existing_order.symbol
         self.quantity = quantity
 
-    def json(self):
+    def to_dict(self):
         response = {
             "trade_id": self.trade_id,
             "buyer": self.existing_order.account_id,
@@ -63,172 +105,433 @@ class Trade(object):
             "buying_order": self.existing_order.order_id,
             "selling_order": self.incoming_order.order_id,
             "symbol": self.symbol,
-            "price": str(self.price),
+            "price": str(from_ticks(self.price, self.existing_order.tick_size)),
             "timestamp": str(self.timestamp),
             "quantity": str(self.quantity)
         }
         if self.existing_order.side == "BUY":
-            response["buyer"] = self.existing_order.account_id,
-            response["seller"] = self.incoming_order.account_id,
+            response["buyer"] = [self.existing_order.account_id]
+            response["seller"] = [self.incoming_order.account_id]
             response["buying_order"] = self.existing_order.order_id
             response["selling_order"] = self.incoming_order.order_id
         else:
-            response["buyer"] = self.incoming_order.account_id,
-            response["seller"] = self.existing_order.account_id,
+            response["buyer"] = [self.incoming_order.account_id]
+            response["seller"] = [self.existing_order.account_id]
             response["buying_order"] = self.incoming_order.order_id
             response["selling_order"] = self.existing_order.order_id
-        return json.dumps(response)
+        return response
+
+    def json(self):
+        return json.dumps(self.to_dict())
+
+    def __setstate__(self, state):
+        _restore_slots(self, state)
 
     def __repr__(self):
         sender = self.existing_order.account_id
         receiver = self.incoming_order.account_id
-        return f"{self.quantity} {self.symbol} @ {self.price}: Accounts {sender} & {receiver}"
+        price = from_ticks(self.price, self.existing_order.tick_size)
+        return f"{self.quantity} {self.symbol} @ {price}: Accounts {sender} & {receiver}"
+
+class Execution(object):
+
+    __slots__ = ("event", "order", "price", "quantity", "trade")
+
+    def __init__(self, event, order, price, quantity, trade=None):
+        self.event = event
+        self.order = order
+        self.price = price
+        self.quantity = quantity
+        self.trade = trade
+
+    def to_dict(self):
+        response = {
+            "event": self.event,
+            "order_id": self.order.order_id,
+            "price": str(from_ticks(self.price, self.order.tick_size)),
+            "quantity": str(self.quantity)
+        }
+        if self.trade is not None:
+            response["trade_id"] = self.trade.trade_id
+        return response
+
+    def __setstate__(self, state):
+        _restore_slots(self, state)
+
+    def __repr__(self):
+        price = from_ticks(self.price, self.order.tick_size)
+        return f"{self.event} {self.order.order_id}: {self.quantity} @ {price}"
+
+class ExecutionReport(object):
+
+    __slots__ = ("order", "results", "executions", "trades", "completed_orders", "changed_orders",
+                 "changed_levels", "levels")
+
+    def __init__(self):
+        self.order = None
+        self.results = None
+        self.executions = []
+        self.trades = {}
+        self.completed_orders = {}
+        self.changed_orders = {}
+        self.changed_levels = set()
+        self.levels = ({}, {})
+
+    def fills(self):
+        return [execution for execution in self.executions if execution.event == FILL]
+
+    def to_dict(self):
+        return {
+            "order": self.order.to_dict() if self.order is not None else None,
+            "executions": [execution.to_dict() for execution in self.executions],
+            "trades": [trade.to_dict() for trade in self.trades.values()],
+            "completed_orders": [order.to_dict() for order in self.completed_orders.values()]
+        }
+
+    def __setstate__(self, state):
+        _restore_slots(self, state)
 
 class OrderList(object):
 
+    __slots__ = ("side", "price", "orders", "volume", "length")
+
     def __init__(self, side, price):
         self.side = side
         self.price = price
-        self.orders = []
+        self.orders = OrderedDict()
         self.volume = 0
         self.length = 0
 
     def __len__(self):
         return self.length
 
+    def __iter__(self):
+        return iter(self.orders.values())
+
+    def head(self):
+        head_order = None
+        if self.orders:
+            head_order = next(iter(self.orders.values()))
+        return head_order
+
     def remove_partial(self, quantity):
         self.volume -= quantity
 
-    def sort_orders(self):
-        self.orders.sort(key=lambda x: x.timestamp)
-
     def add_order(self, order):
         if self.price == order.price:
-            self.orders.append(order)
+            self.orders[order.order_id] = order
             self.volume += order.quantity
             self.length += 1
-            self.sort_orders()
         else:
             raise PriceError("Incorrect order list for order price.")
 
     def remove_order(self, order):
-        found = False
-        for orders in self.orders:
-            if order.order_id == orders.order_id:
-                self.orders.remove(orders)
-                self.volume -= order.quantity
-                self.length -= 1
-                self.sort_orders()
-                found = True
-        if not found:
+        if order.order_id not in self.orders:
             raise OrderError("This order does not exist in the order list.")
+        del self.orders[order.order_id]
+        self.volume -= order.quantity
+        self.length -= 1
+
+    def pop_order(self):
+        order_id, order = self.orders.popitem(last=False)
+        self.volume -= order.quantity
+        self.length -= 1
+        return order
+
+    def __setstate__(self, state):
+        _restore_slots(self, state)
+        if isinstance(self.orders, list):
+            self.orders = OrderedDict((order.order_id, order) for order in sorted(self.orders, key=lambda x: x.timestamp))
+            self.volume = sum(order.quantity for order in self.orders.values())
+
+    def __repr__(self):
+        return str(list(self.orders.values()))
+
+class PriceLevels(object):
+
+    def __init__(self, side):
+        self.side = side
+        self.levels = {}
+        self.prices = []
+
+    def __getitem__(self, price):
+        return self.levels[price]
+
+    def __setitem__(self, price, order_list):
+        if price not in self.levels:
+            insort(self.prices, price)
+        self.levels[price] = order_list
+
+    def __delitem__(self, price):
+        del self.levels[price]
+        del self.prices[bisect_left(self.prices, price)]
+
+    def __contains__(self, price):
+        return price in self.levels
+
+    def __iter__(self):
+        if self.side == "BUY":
+            return reversed(self.prices)
+        return iter(self.prices)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def best(self):
+        best_price = None
+        if self.prices:
+            best_price = self.prices[-1] if self.side == "BUY" else self.prices[0]
+        return best_price
+
+    def keys(self):
+        return self.levels.keys()
+
+    def values(self):
+        return self.levels.values()
+
+    def items(self):
+        return self.levels.items()
+
+    def __repr__(self):
+        return str({price: self.levels[price] for price in self})
+
+class PriceLadder(object):
+
+    def __init__(self, side, low, high):
+        self.side = side
+        self.low = low
+        self.high = high
+        self.ladder = [None] * (high - low + 1)
+        self.step = -1 if side == "BUY" else 1
+        self.best_index = None
+        self.length = 0
+
+    def _index(self, price):
+        if not self.low <= price <= self.high:
+            raise PriceError("Price is outside the price band for this order book.")
+        return price - self.low
+
+    def _next_index(self, index):
+        while 0 <= index < len(self.ladder):
+            if self.ladder[index] is not None:
+                return index
+            index += self.step
+        return None
+
+    def __getitem__(self, price):
+        order_list = self.ladder[self._index(price)]
+        if order_list is None:
+            raise KeyError(price)
+        return order_list
+
+    def __setitem__(self, price, order_list):
+        index = self._index(price)
+        if self.ladder[index] is None:
+            self.length += 1
+            if self.best_index is None or (index - self.best_index) * self.step < 0:
+                self.best_index = index
+        self.ladder[index] = order_list
+
+    def __delitem__(self, price):
+        index = self._index(price)
+        if self.ladder[index] is None:
+            raise KeyError(price)
+        self.ladder[index] = None
+        self.length -= 1
+        if index == self.best_index:
+            self.best_index = self._next_index(index)
+
+    def __contains__(self, price):
+        return self.low <= price <= self.high and self.ladder[price - self.low] is not None
+
+    def __iter__(self):
+        index = self.best_index
+        while index is not None:
+            yield index + self.low
+            index = self._next_index(index + self.step)
+
+    def __len__(self):
+        return self.length
+
+    def best(self):
+        best_price = None
+        if self.best_index is not None:
+            best_price = self.best_index + self.low
+        return best_price
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self.ladder[price - self.low] for price in self]
+
+    def items(self):
+        return [(price, self.ladder[price - self.low]) for price in self]
 
     def __repr__(self):
-        return str(self.orders)
+        return str(dict(self.items()))
 
 class OrderBook(object):
 
-    def __init__(self, symbol):
+    def __init__(self, symbol, tick_size=None, price_band=None):
         self.symbol = symbol
-        self.bids = {}
-        self.asks = {}
+        self.tick_size = None
+        self.price_band = None
+        if tick_size is not None:
+            self.tick_size = Decimal(str(tick_size))
+        if price_band:
+            if self.tick_size is None:
+                raise PriceError("A price band requires a tick size.")
+            self.price_band = tuple(to_ticks(price, self.tick_size) for price in price_band)
+            self.bids = PriceLadder("BUY", *self.price_band)
+            self.asks = PriceLadder("SELL", *self.price_band)
+        else:
+            self.bids = PriceLevels("BUY")
+            self.asks = PriceLevels("SELL")
         self.side_mapping = {"BUY": self.bids, "SELL": self.asks}
-        self.best_price = {"BUY": self.get_min_ask, "SELL": self.get_max_bid}
+        self.match_mapping = {"BUY": self.asks, "SELL": self.bids}
         self.type_mapping = {"MARKET": self._process_market_order, "LIMIT": self._process_limit_order}
         self.bid_volume = 0
         self.ask_volume = 0
-        self.ongoing_orders = {}
+        self.orders = {}
+
+    @property
+    def ongoing_orders(self):
+        return {order_id: order.json() for order_id, order in self.orders.items()}
 
     def get_max_bid(self):
-        max_bid = None
-        if self.bids:
-            max_bid = max(self.bids)
-        return max_bid
+        return self.bids.best()
 
     def get_min_ask(self):
-        min_ask = None
-        if self.asks:
-            min_ask = min(self.asks)
-        return min_ask
-
-    def process_order(self, quote):
-        self.completed_orders = {}
-        self.completed_trades = {}
-        order = None
-        if quote["symbol"] == self.symbol:
-            order = Order(quote)
-            self.ongoing_orders[order.order_id] = order.json()
-            self._direct_order(order)
-        else:
-            raise OrderError("Symbol not correct for this order book.")
-        return order.json()
+        return self.asks.best()
+
+    def get_order(self, order_id):
+        return self.orders.get(str(order_id))
+
+    def depth(self):
+        bids = {self.to_price(price): self.bids[price].volume for price in self.bids}
+        asks = {self.to_price(price): self.asks[price].volume for price in self.asks}
+        return bids, asks, self.bid_volume, self.ask_volume
+
+    def to_ticks(self, price):
+        if self.tick_size is None:
+            return price
+        return to_ticks(price, self.tick_size)
+
+    def to_price(self, ticks):
+        return from_ticks(ticks, self.tick_size)
+
+    def process_order(self, quote, order_id=None, timestamp=None):
+        report = ExecutionReport()
+        report.order = self._place_order(quote, report, order_id, timestamp)
+        return self._finish_report(report)
+
+    def process_orders(self, quotes, order_ids=None, timestamps=None):
+        report = ExecutionReport()
+        order_ids = order_ids or [None] * len(quotes)
+        timestamps = timestamps or [None] * len(quotes)
+        report.results = []
+        for quote, order_id, timestamp in zip(quotes, order_ids, timestamps):
+            try:
+                report.results.append(self._place_order(quote, report, order_id, timestamp))
+            except Error as err:
+                report.results.append(err)
+        return self._finish_report(report)
 
     def cancel_order(self, order_id):
+        report = ExecutionReport()
         order = self._get_order_by_id(order_id)
         if order.trades:
             raise OrderError("Order has already been partially filled.")
         else:
-            self.side_mapping[order.side][order.price].remove_order(order)
-            del self.ongoing_orders[order.order_id]
-            self._remove_empty_order_lists()
+            self._cancel_order(order, report)
+            report.order = order
+        return self._finish_report(report)
 
-    def modify_order(self, order_id, quote):
+    def modify_order(self, order_id, quote, new_order_id=None, timestamp=None):
+        report = ExecutionReport()
         order = self._get_order_by_id(order_id)
+        if quote["symbol"] != self.symbol:
+            raise OrderError("Symbol not correct for this order book.")
         if order.trades:
             raise OrderError("Order has already been partially filled.")
         else:
-            self.cancel_order(order.order_id)
-            new_order = self.process_order(quote)
-        return new_order
+            self._cancel_order(order, report)
+            try:
+                report.order = self._place_order(quote, report, new_order_id, timestamp)
+            except Error as err:
+                # The original order is gone by now, so callers still need what the cancel changed.
+                err.report = self._finish_report(report)
+                raise
+        return self._finish_report(report)
+
+    def _cancel_order(self, order, report):
+        order_list = self.side_mapping[order.side][order.price]
+        order_list.remove_order(order)
+        self._update_volume(order.side, -order.quantity)
+        del self.orders[order.order_id]
+        report.executions.append(Execution(CANCEL, order, order.price, order.quantity))
+        report.changed_orders[order.order_id] = None
+        # Equal prices can be written differently (100.5 and 100.50), the level's own key is what depth shows.
+        report.changed_levels.add((order.side, order_list.price))
+        self._remove_empty_order_list(order.side, order.price)
+
+    def _finish_report(self, report):
+        bids, asks = report.levels
+        for side, price in report.changed_levels:
+            price_levels, levels = (self.bids, bids) if side == "BUY" else (self.asks, asks)
+            levels[self.to_price(price)] = price_levels[price].volume if price in price_levels else 0
+        return report
 
     def _get_order_by_id(self, order_id):
-        order = None
-        if str(order_id) in list(self.ongoing_orders.keys()):
-            order_json = json.loads(self.ongoing_orders[order_id])
-            order_list = self.side_mapping[str(order_json["side"])][Decimal(order_json["price"])]
-            for orders in order_list.orders:
-                if orders.order_id == order_id:
-                    order = orders
+        order = self.get_order(order_id)
         if not order:
             raise OrderError("No order with that order ID currently exists.")
         return order
 
-    def _direct_order(self, order):
-        self.bid_volume = sum([order_list.volume for order_list in self.bids.values()])
-        self.ask_volume = sum([order_list.volume for order_list in self.asks.values()])
-        self.type_mapping[order.order_type](order, self.best_price[order.side]())
-
-    def _process_market_order(self, order, best_price):
-        order_list = None
-        if order.side == "BUY":
-            if self.ask_volume >= order.quantity:
-                order_list = self.asks[best_price]
-        elif order.side == "SELL":
-            if self.bid_volume >= order.quantity:
-                order_list = self.bids[best_price]
-        if best_price and order_list:
-            order.price = best_price
-            self._process_trades(order, order_list, best_price)
+    def _place_order(self, quote, report, order_id=None, timestamp=None):
+        order = None
+        if quote["symbol"] == self.symbol:
+            order = Order(quote, self.tick_size, order_id, timestamp)
+            if self.price_band and order.price is not None:
+                low, high = self.price_band
+                if not low <= order.price <= high:
+                    raise PriceError("Price is outside the price band for this order book.")
+            self._direct_order(order, report)
         else:
-            raise MarketError("Can not process market order without market.")
+            raise OrderError("Symbol not correct for this order book.")
+        return order
 
-    def _process_limit_order(self, order, best_price):
-        if best_price:
-            if order.side == "BUY" and order.price >= best_price:
-                order_list = self.asks[best_price]
-                self._process_trades(order, order_list, best_price)
-            elif order.side == "SELL" and order.price <= best_price:
-                order_list = self.bids[best_price]
-                self._process_trades(order, order_list, best_price)
-            else:
-                self._update_order_book(order)
+    def _direct_order(self, order, report):
+        self.type_mapping[order.order_type](order, report)
+
+    def _process_market_order(self, order, report):
+        available_volume = self.ask_volume if order.side == "BUY" else self.bid_volume
+        if available_volume and available_volume >= order.quantity:
+            self._process_trades(order, report)
         else:
-            self._update_order_book(order)
+            raise MarketError("Can not process market order without market.")
 
-    def _process_trades(self, order, order_list, best_price):
-        fulfilled_orders = []
-        for existing_order in order_list.orders:
-            if order.quantity > 0:
+    def _process_limit_order(self, order, report):
+        self._process_trades(order, report)
+        if order.quantity > 0:
+            self._update_order_book(order, report)
+
+    def _process_trades(self, order, report):
+        price_levels = self.match_mapping[order.side]
+        while order.quantity > 0 and price_levels:
+            best_price = price_levels.best()
+            if order.order_type == "LIMIT":
+                if order.side == "BUY" and order.price < best_price:
+                    break
+                if order.side == "SELL" and order.price > best_price:
+                    break
+            else:
+                order.price = best_price
+            order_list = price_levels[best_price]
+            report.changed_levels.add((order_list.side, best_price))
+            while order.quantity > 0 and order_list:
+                existing_order = order_list.head()
                 remainder = existing_order.quantity - order.quantity
                 if remainder > 0:
                     trade = Trade(existing_order, order, order.quantity)
@@ -237,51 +540,85 @@ class OrderBook(object):
                     order.update(0)
                     order.trades.append(trade.trade_id)
                     existing_order.trades.append(trade.trade_id)
-                    del self.ongoing_orders[order.order_id]
-                    self.ongoing_orders[existing_order.order_id] = existing_order.json()
-                    self.completed_orders[order.order_id] = order.json()
+                    report.changed_orders[existing_order.order_id] = existing_order
+                    report.completed_orders[order.order_id] = order
                 elif remainder == 0:
                     trade = Trade(existing_order, order, order.quantity)
+                    order_list.pop_order()
                     existing_order.update(0)
-                    fulfilled_orders.append(existing_order)
                     order.update(0)
                     order.trades.append(trade.trade_id)
                     existing_order.trades.append(trade.trade_id)
-                    del self.ongoing_orders[order.order_id]
-                    del self.ongoing_orders[existing_order.order_id]
-                    self.completed_orders[order.order_id] = order.json()
-                    self.completed_orders[existing_order.order_id] = existing_order.json()
+                    del self.orders[existing_order.order_id]
+                    report.changed_orders[existing_order.order_id] = None
+                    report.completed_orders[order.order_id] = order
+                    report.completed_orders[existing_order.order_id] = existing_order
                 else:
                     trade = Trade(existing_order, order, existing_order.quantity)
+                    order_list.pop_order()
                     existing_order.update(0)
-                    fulfilled_orders.append(existing_order)
                     order.update(abs(remainder))
                     order.trades.append(trade.trade_id)
                     existing_order.trades.append(trade.trade_id)
-                    del self.ongoing_orders[existing_order.order_id]
-                    self.ongoing_orders[order.order_id] = order.json()
-                    self.completed_orders[existing_order.order_id] = existing_order.json()
-                self.completed_trades[trade.trade_id] = trade.json()
-        for orders in fulfilled_orders:
-            order_list.remove_order(orders)
-        self._remove_empty_order_lists()
-        if order.quantity > 0:
-            self._direct_order(order)
-
-    def _remove_empty_order_lists(self):
-        empty_asks = [key for key, value in self.asks.items() if not value]
-        empty_bids = [key for key, value in self.bids.items() if not value]
-        for asks in empty_asks:
-            del self.asks[asks]
-        for bids in empty_bids:
-            del self.bids[bids]
-
-    def _update_order_book(self, order):
-        order_list = OrderList(order.side, order.price)
-        if order.price in self.bids or order.price in self.asks:
-            order_list = self.side_mapping[order.side][order.price]
-        order_list.add_order(order)
-        self.side_mapping[order.side][order.price] = order_list
+                    del self.orders[existing_order.order_id]
+                    report.changed_orders[existing_order.order_id] = None
+                    report.completed_orders[existing_order.order_id] = existing_order
+                self._update_volume(order_list.side, -trade.quantity)
+                report.trades[trade.trade_id] = trade
+                report.executions.append(Execution(FILL, order, best_price, trade.quantity, trade))
+            if not order_list:
+                del price_levels[best_price]
+
+    def _update_volume(self, side, quantity):
+        if side == "BUY":
+            self.bid_volume += quantity
+        else:
+            self.ask_volume += quantity
+
+    def _remove_empty_order_list(self, side, price):
+        price_levels = self.side_mapping[side]
+        if price in price_levels and not price_levels[price]:
+            del price_levels[price]
+
+    def _update_order_book(self, order, report):
+        price_levels = self.side_mapping[order.side]
+        if order.price in price_levels:
+            order_list = price_levels[order.price]
+            order_list.add_order(order)
+        else:
+            order_list = OrderList(order.side, order.price)
+            order_list.add_order(order)
+            price_levels[order.price] = order_list
+        self._update_volume(order.side, order.quantity)
+        self.orders[order.order_id] = order
+        report.executions.append(Execution(REST, order, order.price, order.quantity))
+        report.changed_orders[order.order_id] = order
+        report.changed_levels.add((order.side, order_list.price))
+
+    def __setstate__(self, state):
+        self.tick_size = None
+        self.price_band = None
+        self.__dict__.update(state)
+        for name in ("completed_orders", "completed_trades", "changed_orders", "changed_levels"):
+            self.__dict__.pop(name, None)
+        for name, side in (("bids", "BUY"), ("asks", "SELL")):
+            if isinstance(state[name], dict):
+                price_levels = PriceLevels(side)
+                for price, order_list in state[name].items():
+                    price_levels[price] = order_list
+                setattr(self, name, price_levels)
+        self.side_mapping = {"BUY": self.bids, "SELL": self.asks}
+        self.match_mapping = {"BUY": self.asks, "SELL": self.bids}
+        self.type_mapping = {"MARKET": self._process_market_order, "LIMIT": self._process_limit_order}
+        self.__dict__.pop("best_price", None)
+        if "orders" not in state:
+            del self.__dict__["ongoing_orders"]
+            self.orders = {}
+            for price_levels in self.side_mapping.values():
+                for order_list in price_levels.values():
+                    self.orders.update(order_list.orders)
+            self.bid_volume = sum(order_list.volume for order_list in self.bids.values())
+            self.ask_volume = sum(order_list.volume for order_list in self.asks.values())
 
     def __repr__(self):
         return f"BIDS: {self.bids}\nASKS: {self.asks}"
@@ -0,0 +1,126 @@
+from decimal import Decimal
+import struct
+
+
+PRICE_SCALE = 10 ** 8
+
+NEW_ORDER = b"N"
+CANCEL_ORDER = b"C"
+MODIFY_ORDER = b"M"
+EXECUTION_REPORT = b"E"
+REJECT = b"R"
+
+STATUS_RESTING = 0
+STATUS_FILLED = 1
+STATUS_CANCELLED = 2
+
+ERROR_CODES = {
+    "ORDER_ERROR": 1,
+    "MARKET_ERROR": 2,
+    "PRICE_ERROR": 3,
+    "SYMBOL_ERROR": 4,
+    "QUANTITY_ERROR": 5,
+    "SIDE_ERROR": 6,
+    "TYPE_ERROR": 7,
+    "PROTOCOL_ERROR": 8,
+    "RISK_ERROR": 9,
+    "INTERNAL_ERROR": 10
+}
+ERROR_NAMES = {code: name for name, code in ERROR_CODES.items()}
+
+# Every frame is a little-endian u16 length of everything after it, then a one byte message type.
+FRAME_HEADER = struct.Struct("<Hc")
+QUOTE = struct.Struct("<8sccqI32s")
+NEW_ORDER_MESSAGE = struct.Struct("<Q")
+CANCEL_ORDER_MESSAGE = struct.Struct("<Q36s")
+MODIFY_ORDER_MESSAGE = struct.Struct("<Q36s")
+EXECUTION_REPORT_MESSAGE = struct.Struct("<QB36sqIIH")
+FILL_RECORD = struct.Struct("<36sqI")
+REJECT_MESSAGE = struct.Struct("<QBH")
+
+SIDES = {"BUY": b"B", "SELL": b"S"}
+ORDER_TYPES = {"LIMIT": b"L", "MARKET": b"M"}
+SIDE_NAMES = {code: name for name, code in SIDES.items()}
+ORDER_TYPE_NAMES = {code: name for name, code in ORDER_TYPES.items()}
+
+
+def frame(message_type, body):
+    return FRAME_HEADER.pack(len(body) + 1, message_type) + body
+
+def encode_price(price):
+    if price is None or price == "None":
+        return 0
+    return int(Decimal(price) * PRICE_SCALE)
+
+def decode_price(price):
+    return Decimal(price) / PRICE_SCALE
+
+def encode_new_order(client_ref, quote):
+    return frame(NEW_ORDER, NEW_ORDER_MESSAGE.pack(client_ref) + _pack_quote(quote))
+
+def encode_cancel_order(client_ref, order_id):
+    return frame(CANCEL_ORDER, CANCEL_ORDER_MESSAGE.pack(client_ref, order_id.encode()))
+
+def encode_modify_order(client_ref, order_id, quote):
+    return frame(MODIFY_ORDER, MODIFY_ORDER_MESSAGE.pack(client_ref, order_id.encode()) + _pack_quote(quote))
+
+def encode_execution_report(client_ref, status, order_id, price, initial_quantity, quantity, fills=()):
+    chunks = [EXECUTION_REPORT_MESSAGE.pack(client_ref, status, order_id.encode(), price, initial_quantity,
+                                            quantity, len(fills))]
+    for trade_id, fill_price, fill_quantity in fills:
+        chunks.append(FILL_RECORD.pack(trade_id.encode(), fill_price, fill_quantity))
+    return frame(EXECUTION_REPORT, b"".join(chunks))
+
+def encode_reject(client_ref, error, reason):
+    reason = reason.encode()
+    return frame(REJECT, REJECT_MESSAGE.pack(client_ref, ERROR_CODES[error], len(reason)) + reason)
+
+def decode(message_type, body):
+    if message_type == NEW_ORDER:
+        client_ref, = NEW_ORDER_MESSAGE.unpack_from(body)
+        return {"client_ref": client_ref, "quote": _unpack_quote(body, NEW_ORDER_MESSAGE.size)}
+    elif message_type == CANCEL_ORDER:
+        client_ref, order_id = CANCEL_ORDER_MESSAGE.unpack_from(body)
+        return {"client_ref": client_ref, "order_id": order_id.decode()}
+    elif message_type == MODIFY_ORDER:
+        client_ref, order_id = MODIFY_ORDER_MESSAGE.unpack_from(body)
+        return {"client_ref": client_ref, "order_id": order_id.decode(),
+                "quote": _unpack_quote(body, MODIFY_ORDER_MESSAGE.size)}
+    elif message_type == EXECUTION_REPORT:
+        client_ref, status, order_id, price, initial_quantity, quantity, count = \
+            EXECUTION_REPORT_MESSAGE.unpack_from(body)
+        fills = []
+        for offset in range(EXECUTION_REPORT_MESSAGE.size, EXECUTION_REPORT_MESSAGE.size + count * FILL_RECORD.size,
+                            FILL_RECORD.size):
+            trade_id, fill_price, fill_quantity = FILL_RECORD.unpack_from(body, offset)
+            fills.append({"trade_id": trade_id.decode(), "price": decode_price(fill_price), "quantity": fill_quantity})
+        return {"client_ref": client_ref, "status": status, "order_id": order_id.decode(),
+                "price": decode_price(price), "initial_quantity": initial_quantity, "quantity": quantity,
+                "fills": fills}
+    elif message_type == REJECT:
+        client_ref, error, length = REJECT_MESSAGE.unpack_from(body)
+        offset = REJECT_MESSAGE.size
+        return {"client_ref": client_ref, "error": ERROR_NAMES.get(error, "PROTOCOL_ERROR"),
+                "reason": bytes(body[offset:offset + length]).decode()}
+    raise ProtocolError(f"Unknown message type {message_type!r}.")
+
+def _pack_quote(quote):
+    price = quote.get("price")
+    return QUOTE.pack(quote["symbol"].encode(), SIDES[quote["side"]], ORDER_TYPES[quote["order_type"]],
+                      encode_price(price), int(quote["quantity"]), str(quote["account_id"]).encode())
+
+def _unpack_quote(body, offset):
+    symbol, side, order_type, price, quantity, account_id = QUOTE.unpack_from(body, offset)
+    quote = {
+        "symbol": symbol.rstrip(b"\0").decode(),
+        "side": SIDE_NAMES.get(side, side.decode("latin-1")),
+        "order_type": ORDER_TYPE_NAMES.get(order_type, order_type.decode("latin-1")),
+        "quantity": quantity,
+        "account_id": account_id.rstrip(b"\0").decode()
+    }
+    if quote["order_type"] == "LIMIT":
+        quote["price"] = decode_price(price)
+    return quote
+
+class ProtocolError(Exception):
+    pass
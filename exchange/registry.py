@@ -0,0 +1,277 @@
+import collections
+import multiprocessing
+import threading
+import zlib
+
+from orderbook import OrderBook
+from orderbook import OrderError, from_ticks
+from snapshot import copy_book, dump_book, encode_book
+
+
+class OrderBookRegistry(object):
+
+    def __init__(self, symbols=None, tick_size=None, price_band=None, books=()):
+        self.symbols = None
+        if symbols is not None:
+            self.symbols = set(symbols)
+        self.tick_size = tick_size
+        self.price_band = price_band
+        self.books = {}
+        self.order_symbols = {}
+        for orderbook in books:
+            self.books[orderbook.symbol] = orderbook
+            self.order_symbols.update(dict.fromkeys(orderbook.orders, orderbook.symbol))
+
+    def __contains__(self, symbol):
+        return self.symbols is None or symbol in self.symbols
+
+    def get(self, symbol):
+        orderbook = self.books.get(symbol)
+        if orderbook is None:
+            if symbol not in self:
+                raise OrderError("Symbol is not listed on this exchange.")
+            orderbook = OrderBook(symbol, self.tick_size, self.price_band)
+            self.books[symbol] = orderbook
+        return orderbook
+
+    def find(self, order_id):
+        symbol = self.order_symbols.get(order_id)
+        if symbol is None:
+            raise OrderError("No order with that order ID currently exists.")
+        return self.get(symbol)
+
+    def update(self, symbol, changed_orders):
+        # Fed from each execution report, so find never has to search the books.
+        for order_id, order in changed_orders.items():
+            if order is None:
+                self.order_symbols.pop(order_id, None)
+            else:
+                self.order_symbols[order_id] = symbol
+
+    def dispatch(self, orderbook, name, args):
+        return _Dispatched(getattr(orderbook, name), args)
+
+    def dumps(self, symbol):
+        return dump_book(self.get(symbol))
+
+    def copy(self, symbol):
+        return copy_book(self.get(symbol))
+
+    def encode(self, book_copy):
+        return encode_book(book_copy)
+
+    def close(self):
+        pass
+
+class ShardedOrderBookRegistry(object):
+
+    def __init__(self, symbols, workers, pins=None, tick_size=None, price_band=None, books=(), max_pending=64):
+        self.symbols = set(symbols)
+        self.workers = workers
+        self.pins = pins or {}
+        self.max_pending = max_pending
+        shard_books = [[] for _ in range(workers)]
+        self.order_symbols = {}
+        for orderbook in books:
+            shard_books[self.shard_for(orderbook.symbol)].append(orderbook)
+            self.order_symbols.update(dict.fromkeys(orderbook.orders, orderbook.symbol))
+        self.connections = []
+        self.locks = []
+        self.pending = []
+        self.processes = []
+        for shard in range(workers):
+            shard_symbols = [symbol for symbol in self.symbols if self.shard_for(symbol) == shard]
+            parent_connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_serve_shard,
+                args=(child_connection, shard_symbols, tick_size, price_band, shard_books[shard]),
+                daemon=True
+            )
+            process.start()
+            self.connections.append(parent_connection)
+            self.locks.append(threading.Lock())
+            self.pending.append(collections.deque())
+            self.processes.append(process)
+        self.books = {}
+
+    def __contains__(self, symbol):
+        return symbol in self.symbols
+
+    def shard_for(self, symbol):
+        if symbol in self.pins:
+            return self.pins[symbol] % self.workers
+        return zlib.crc32(symbol.encode()) % self.workers
+
+    def get(self, symbol):
+        orderbook = self.books.get(symbol)
+        if orderbook is None:
+            if symbol not in self:
+                raise OrderError("Symbol is not listed on this exchange.")
+            orderbook = RemoteOrderBook(self, symbol)
+            self.books[symbol] = orderbook
+        return orderbook
+
+    def find(self, order_id):
+        symbol = self.order_symbols.get(order_id)
+        if symbol is None:
+            raise OrderError("No order with that order ID currently exists.")
+        return self.get(symbol)
+
+    update = OrderBookRegistry.update
+
+    def dumps(self, symbol):
+        return self.request(self.shard_for(symbol), ("dumps", symbol, None, ()))
+
+    def copy(self, symbol):
+        # The copy stays in the shard process, encode fetches it from there once it is encoded.
+        self.request(self.shard_for(symbol), ("copy", symbol, None, ()))
+        return symbol
+
+    def encode(self, symbol):
+        return self.request(self.shard_for(symbol), ("encode", symbol, None, ()))
+
+    def dispatch(self, orderbook, name, args):
+        # Returns as soon as the command is on its way, so commands for different shards match in
+        # parallel. The reply carries the report and the book's new top, in a single round trip.
+        return self.send(orderbook.shard, ("call", orderbook.symbol, name, args), orderbook)
+
+    def request(self, shard, message):
+        return self.send(shard, message).result()
+
+    def send(self, shard, message, orderbook=None):
+        reply = _Reply(self, shard, orderbook)
+        with self.locks[shard]:
+            # Bounded so neither side of the pipe can fill up while the other waits to write.
+            while len(self.pending[shard]) >= self.max_pending:
+                self.pending[shard].popleft().set(*self.connections[shard].recv())
+            self.connections[shard].send(message)
+            self.pending[shard].append(reply)
+        return reply
+
+    def receive(self, reply):
+        # Replies come back in the order the requests went out, whichever thread is waiting.
+        with self.locks[reply.shard]:
+            while not reply.done:
+                self.pending[reply.shard].popleft().set(*self.connections[reply.shard].recv())
+        if reply.error is not None:
+            raise reply.error
+        return reply.value
+
+    def close(self):
+        for shard, connection in enumerate(self.connections):
+            with self.locks[shard]:
+                connection.send(None)
+        for process in self.processes:
+            process.join()
+
+class RemoteOrderBook(object):
+
+    def __init__(self, registry, symbol):
+        self.registry = registry
+        self.symbol = symbol
+        self.shard = registry.shard_for(symbol)
+        self.methods = {}
+        self.tick_size, top = registry.request(self.shard, ("state", symbol, None, ()))
+        self.update_top(top)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self.methods:
+            value = self.registry.request(self.shard, ("getattr", self.symbol, name, ()))
+            if value != _METHOD:
+                return value
+            self.methods[name] = lambda *args: self.registry.dispatch(self, name, args).result()
+        return self.methods[name]
+
+    def update_top(self, top):
+        self.max_bid, self.min_ask, self.bid_volume, self.ask_volume = top
+
+    def get_max_bid(self):
+        return self.max_bid
+
+    def get_min_ask(self):
+        return self.min_ask
+
+    def to_price(self, ticks):
+        return from_ticks(ticks, self.tick_size)
+
+    def __repr__(self):
+        return f"{self.symbol} @ shard {self.shard}"
+
+class _Dispatched(object):
+
+    __slots__ = ("value", "error")
+
+    def __init__(self, function, args):
+        self.value = None
+        self.error = None
+        try:
+            self.value = function(*args)
+        except Exception as err:
+            self.error = err
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+class _Reply(object):
+
+    __slots__ = ("registry", "shard", "orderbook", "value", "error", "done")
+
+    def __init__(self, registry, shard, orderbook=None):
+        self.registry = registry
+        self.shard = shard
+        self.orderbook = orderbook
+        self.value = None
+        self.error = None
+        self.done = False
+
+    def set(self, value, error, top):
+        self.value = value
+        self.error = error
+        self.done = True
+        if top is not None and self.orderbook is not None:
+            self.orderbook.update_top(top)
+
+    def result(self):
+        return self.registry.receive(self)
+
+_METHOD = "__method__"
+
+def _serve_shard(connection, symbols, tick_size, price_band, books):
+    registry = OrderBookRegistry(symbols, tick_size, price_band, books)
+    copies = {}
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        action, symbol, name, args = message
+        value, error, top = None, None, None
+        try:
+            if action == "dumps":
+                value = registry.dumps(symbol)
+            elif action == "copy":
+                copies[symbol] = registry.copy(symbol)
+            elif action == "encode":
+                value = registry.encode(copies.pop(symbol))
+            elif action == "state":
+                orderbook = registry.get(symbol)
+                value = orderbook.tick_size, _top(orderbook)
+            else:
+                value = getattr(registry.get(symbol), name)
+                if action == "call":
+                    value = value(*args)
+                elif callable(value):
+                    value = _METHOD
+        except Exception as err:
+            value, error = None, err
+        if action == "call" and symbol in registry.books:
+            # Sent back with every call, so the parent can read best prices and volumes locally.
+            top = _top(registry.books[symbol])
+        connection.send((value, error, top))
+    connection.close()
+
+def _top(orderbook):
+    return orderbook.get_max_bid(), orderbook.get_min_ask(), orderbook.bid_volume, orderbook.ask_volume
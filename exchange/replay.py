@@ -0,0 +1,177 @@
+import argparse
+from datetime import datetime, timedelta
+from decimal import Decimal
+import glob
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from orderbook import Error, OrderError
+from registry import OrderBookRegistry
+from results import report_results
+from snapshot import dump_book, dump_snapshot, load_snapshot_file
+
+
+REPLAY_ID_NAMESPACE = uuid.UUID("0d1c3a55-7f8e-4b8a-9a5e-3c2f6d9e1b47")
+REPLAY_EPOCH = datetime(2000, 1, 1)
+
+
+def apply_command(registry, record):
+    quotes = record.get("quotes") or [record.get("quote")]
+    for quote in quotes:
+        if quote and quote.get("price") is not None:
+            quote["price"] = Decimal(quote["price"])
+    try:
+        orderbook = command_book(registry, record)
+        report = execute_command(orderbook, record)
+    except Error as err:
+        # A failed edit has still cancelled the original order.
+        if getattr(err, "report", None) is not None:
+            registry.update(orderbook.symbol, err.report.changed_orders)
+        return None
+    registry.update(orderbook.symbol, report.changed_orders)
+    return report
+
+def command_book(registry, record):
+    if record["command"] == "new":
+        return registry.get(record["quote"]["symbol"])
+    elif record["command"] == "batch":
+        if not record["quotes"]:
+            raise OrderError("A batch needs at least one quote.")
+        return registry.get(record["quotes"][0]["symbol"])
+    elif record["command"] in ("edit", "cancel"):
+        return registry.find(record["order_id"])
+    raise OrderError("Unknown command.")
+
+def execute_command(orderbook, record):
+    name, args = command_call(record)
+    return getattr(orderbook, name)(*args)
+
+def command_call(record):
+    if record["command"] == "new":
+        return "process_order", (record["quote"], record["order_id"], _timestamp(record["timestamp"]))
+    elif record["command"] == "batch":
+        timestamps = [_timestamp(timestamp) for timestamp in record["timestamps"]]
+        return "process_orders", (record["quotes"], record["order_ids"], timestamps)
+    elif record["command"] == "edit":
+        return "modify_order", (
+            record["order_id"], record["quote"], record["new_order_id"], _timestamp(record["timestamp"]))
+    elif record["command"] == "cancel":
+        return "cancel_order", (record["order_id"],)
+
+def _timestamp(timestamp):
+    if isinstance(timestamp, datetime):
+        return timestamp
+    return datetime.fromisoformat(timestamp)
+
+def read_records(source):
+    if os.path.isdir(source):
+        sources = sorted(glob.glob(os.path.join(source, "journal-*.log")))
+    else:
+        sources = [source]
+    seq = 0
+    for file_name in sources:
+        with open(file_name, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line, parse_float=Decimal)
+                except ValueError:
+                    break
+                seq += 1
+                yield _normalize(record, seq)
+
+def _normalize(record, seq):
+    if "command" not in record:
+        record = {"command": "new", "quote": record}
+    seq = record.setdefault("seq", seq)
+    timestamp = str(REPLAY_EPOCH + timedelta(microseconds=seq))
+    if record["command"] in ("new", "edit"):
+        record.setdefault("timestamp", timestamp)
+        record.setdefault("new_order_id" if record["command"] == "edit" else "order_id", _replay_id(seq))
+    elif record["command"] == "batch":
+        record.setdefault("order_ids", [_replay_id(seq, i) for i in range(len(record["quotes"]))])
+        record.setdefault("timestamps", [timestamp] * len(record["quotes"]))
+    return record
+
+def _replay_id(seq, index=0):
+    return str(uuid.uuid5(REPLAY_ID_NAMESPACE, f"{seq}:{index}"))
+
+def replay(records, registry=None, after_seq=0, tape=None):
+    registry = registry or OrderBookRegistry()
+    commands = 0
+    rejects = 0
+    trades = 0
+    last_seq = after_seq
+    tape_hash = hashlib.sha256()
+    start = time.perf_counter()
+    for record in records:
+        if record["seq"] <= after_seq:
+            continue
+        commands += 1
+        last_seq = record["seq"]
+        report = apply_command(registry, record)
+        if report is None:
+            rejects += 1
+            continue
+        trades += len(report.trades)
+        if tape is not None:
+            for trade in report.trades.values():
+                line = json.dumps(trade.to_dict()) + "\n"
+                tape_hash.update(line.encode())
+                tape.write(line)
+    elapsed = time.perf_counter() - start
+    return registry, {
+        "commands": commands,
+        "rejects": rejects,
+        "trades": trades,
+        "last_seq": last_seq,
+        "resting_orders": sum(len(orderbook.orders) for orderbook in registry.books.values()),
+        "elapsed_s": elapsed,
+        "commands_per_sec": commands / elapsed if elapsed else 0.0,
+        "trades_per_sec": trades / elapsed if elapsed else 0.0,
+        "tape_sha256": tape_hash.hexdigest() if tape is not None else None,
+        "book_sha256": book_digest(registry)
+    }
+
+def book_digest(registry):
+    book_hash = hashlib.sha256()
+    for symbol in sorted(registry.books):
+        book_hash.update(dump_book(registry.books[symbol]))
+    return book_hash.hexdigest()
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded command log through the matching engine. "
+                                                 "No Redis, Mongo or Flask required.")
+    parser.add_argument("source", help="journal directory, journal segment or JSON lines file. Lines are journal "
+                                       "records or bare quotes; missing order ids and timestamps are derived "
+                                       "from the line's sequence number")
+    parser.add_argument("--snapshot", help="start from this snapshot and skip the records it already covers")
+    parser.add_argument("--tick-size", help="run the engine on integer ticks of this size")
+    parser.add_argument("--price-band", nargs=2, metavar=("LOW", "HIGH"),
+                        help="use an array price ladder over this band (requires --tick-size)")
+    parser.add_argument("--trades", help="write the trade tape as JSON lines to this file")
+    parser.add_argument("--book", help="write the final books as a snapshot to this file")
+    parser.add_argument("--output", help="append results as JSON lines to this file")
+    args = parser.parse_args()
+    seq, books = 0, ()
+    if args.snapshot:
+        seq, books = load_snapshot_file(args.snapshot)
+    registry = OrderBookRegistry(None, args.tick_size, args.price_band, books)
+    tape = open(args.trades, "w") if args.trades else None
+    try:
+        registry, results = replay(read_records(args.source), registry, seq, tape)
+    finally:
+        if tape:
+            tape.close()
+    if args.book:
+        sections = [dump_book(registry.books[symbol]) for symbol in sorted(registry.books)]
+        with open(args.book, "wb") as f:
+            f.write(dump_snapshot(results["last_seq"], sections))
+    report_results("replay", results, args.output, source=args.source)
+
+if __name__ == "__main__":
+    main()
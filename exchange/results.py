@@ -0,0 +1,17 @@
+from datetime import datetime
+import json
+import platform
+
+
+def print_results(label, results, precision=2):
+    print(f"{label}: " + ", ".join(f"{key}={value:.{precision}f}" if isinstance(value, float) else f"{key}={value}"
+                                   for key, value in results.items()))
+
+def report_results(label, results, output=None, **fields):
+    # Every command line tool prints its results the same way and appends them to the same kind of
+    # JSON lines file, so runs from different tools can be compared side by side.
+    print_results(label, results)
+    if output:
+        record = dict(fields, timestamp=str(datetime.now()), python=platform.python_version(), results=results)
+        with open(output, "a") as f:
+            f.write(json.dumps(record) + "\n")
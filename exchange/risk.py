@@ -0,0 +1,148 @@
+from decimal import Decimal
+import time
+
+from orderbook import Error, from_ticks
+
+
+DEFAULT_LIMITS = {
+    "max_open_quantity": None,
+    "max_notional": None,
+    "max_orders_per_second": None,
+    "price_collar": None
+}
+
+
+class RiskEngine(object):
+
+    def __init__(self, limits=None, account_limits=None, clock=time.monotonic):
+        self.limits = _limits(DEFAULT_LIMITS, limits or {})
+        self.account_limits = {str(account_id): _limits(self.limits, overrides)
+                               for account_id, overrides in (account_limits or {}).items()}
+        self.clock = clock
+        self.limited = any(value is not None for limits in [self.limits, *self.account_limits.values()]
+                           for value in limits.values())
+        self.open_quantity = {}
+        self.open_notional = {}
+        self.orders = {}
+        self.rates = {}
+        self.rejects = 0
+
+    def load(self, orders):
+        for order in orders:
+            self._add(order)
+
+    def update(self, changed_orders):
+        # Exposure only moves when an order rests, fills or leaves the book, all of which the
+        # engine reports in changed_orders, so the cost is per change rather than per order.
+        for order_id, order in changed_orders.items():
+            self._remove(order_id)
+            if order is not None:
+                self._add(order)
+
+    def check(self, orderbook, quote, replaces=None, record=True):
+        self.check_all(orderbook, [quote], replaces, record, raise_errors=True)
+
+    def check_all(self, orderbook, quotes, replaces=None, record=True, raise_errors=False):
+        # Quotes accepted earlier in the same call count as resting for the ones after them.
+        errors = []
+        pending = {}
+        for quote in quotes:
+            try:
+                self._check(orderbook, quote, replaces, pending)
+            except RiskError as err:
+                self.rejects += 1
+                if raise_errors:
+                    raise
+                errors.append(err)
+                continue
+            errors.append(None)
+            if record:
+                self._count(str(quote["account_id"]))
+        return errors
+
+    def exposure(self, account_id):
+        account_id = str(account_id)
+        return self.open_quantity.get(account_id, 0), self.open_notional.get(account_id, 0)
+
+    def stats(self):
+        return {"accounts": len(self.open_quantity), "orders": len(self.orders), "rejects": self.rejects}
+
+    def _check(self, orderbook, quote, replaces, pending):
+        account_id = str(quote["account_id"])
+        limits = self.account_limits.get(account_id, self.limits)
+        quantity = int(quote["quantity"])
+        if quote["order_type"] == "LIMIT":
+            price = quote["price"]
+        elif quote["side"] == "BUY":
+            price = orderbook.to_price(orderbook.get_min_ask())
+        else:
+            price = orderbook.to_price(orderbook.get_max_bid())
+        open_quantity, open_notional = self.exposure(account_id)
+        pending_quantity, pending_notional = pending.get(account_id, (0, 0))
+        open_quantity += pending_quantity
+        open_notional += pending_notional
+        if replaces in self.orders:
+            replaced_account, replaced_quantity, replaced_notional = self.orders[replaces]
+            if replaced_account == account_id:
+                open_quantity -= replaced_quantity
+                open_notional -= replaced_notional
+        notional = price * quantity if price is not None else 0
+        if limits["max_open_quantity"] is not None and open_quantity + quantity > limits["max_open_quantity"]:
+            raise RiskError("Order would exceed the account's maximum open quantity.")
+        if limits["max_notional"] is not None and open_notional + notional > limits["max_notional"]:
+            raise RiskError("Order would exceed the account's maximum notional.")
+        if limits["max_orders_per_second"] is not None:
+            start, count = self.rates.get(account_id, (None, 0))
+            if start is not None and self.clock() - start < 1 and count >= limits["max_orders_per_second"]:
+                raise RiskError("Order rate limit exceeded for this account.")
+        if limits["price_collar"] is not None and quote["order_type"] == "LIMIT":
+            best_bid = orderbook.to_price(orderbook.get_max_bid())
+            best_ask = orderbook.to_price(orderbook.get_min_ask())
+            if best_bid is not None and best_ask is not None:
+                reference = (best_bid + best_ask) / 2
+            else:
+                reference = best_bid if best_bid is not None else best_ask
+            if reference is not None and abs(price - reference) > reference * limits["price_collar"]:
+                raise RiskError("Price is outside the collar around the best bid and offer.")
+        pending[account_id] = (pending_quantity + quantity, pending_notional + notional)
+
+    def _count(self, account_id):
+        now = self.clock()
+        start, count = self.rates.get(account_id, (None, 0))
+        if start is None or now - start >= 1:
+            start, count = now, 0
+        self.rates[account_id] = (start, count + 1)
+
+    def _add(self, order):
+        account_id = str(order.account_id)
+        quantity = _number(order.quantity)
+        notional = _number(from_ticks(order.price, order.tick_size)) * quantity
+        self.orders[order.order_id] = (account_id, quantity, notional)
+        self.open_quantity[account_id] = self.open_quantity.get(account_id, 0) + quantity
+        self.open_notional[account_id] = self.open_notional.get(account_id, 0) + notional
+
+    def _remove(self, order_id):
+        entry = self.orders.pop(order_id, None)
+        if entry is None:
+            return
+        account_id, quantity, notional = entry
+        self.open_quantity[account_id] -= quantity
+        self.open_notional[account_id] -= notional
+        if not self.open_quantity[account_id]:
+            del self.open_quantity[account_id]
+            del self.open_notional[account_id]
+
+class RiskError(Error):
+    pass
+
+def _limits(defaults, overrides):
+    limits = dict(defaults)
+    limits.update((name, _number(value)) for name, value in overrides.items())
+    return limits
+
+def _number(value):
+    # Limits configured as floats, and orders journaled before quantities were normalised, do not
+    # mix with Decimal prices.
+    if isinstance(value, float):
+        return Decimal(str(value))
+    return value
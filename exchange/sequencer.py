@@ -0,0 +1,145 @@
+import asyncio
+import queue
+import threading
+
+
+class Sequencer(object):
+
+    def __init__(self, execute, commit, max_batch=256, execute_all=None):
+        self.execute = execute
+        self.commit = commit
+        self.max_batch = max_batch
+        self.execute_all = execute_all
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.commands = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, command):
+        return self.submit_all([command])[0]
+
+    def submit_all(self, commands):
+        entries = [_Entry(self.execute, command) for command in commands]
+        for entry in entries:
+            self._put(entry)
+        return [entry.wait() for entry in entries]
+
+    def submit_async(self, command):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = _Entry(self.execute, command)
+        entry.callback = lambda: loop.call_soon_threadsafe(_resolve, future, entry)
+        self._put(entry)
+        return future
+
+    def query(self, function, *args):
+        entry = _Entry(function, *args)
+        entry.query = True
+        self._put(entry)
+        return entry.wait()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "commands": self.commands,
+            "commands_per_batch": self.commands / self.batches if self.batches else 0.0,
+            "queue_depth": self.queue.qsize()
+        }
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+
+    def _put(self, entry):
+        if self.closed:
+            raise SequencerError("Sequencer has been closed.")
+        self.queue.put(entry)
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            batch = [entry]
+            while entry is not None and len(batch) < self.max_batch:
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(entry)
+            closing = batch[-1] is None
+            if closing:
+                batch.pop()
+            commands = [entry for entry in batch if not entry.query]
+            if self.execute_all is not None and commands:
+                self._run_all(commands)
+            else:
+                for entry in commands:
+                    entry.run()
+            executed = [entry for entry in commands if entry.error is None]
+            if executed:
+                try:
+                    self.commit([entry.result for entry in executed])
+                except Exception as err:
+                    for entry in executed:
+                        entry.error = err
+                self.batches += 1
+                self.commands += len(executed)
+            # Queries run after the commit so they never observe a command that is not yet durable.
+            for entry in batch:
+                if entry.query:
+                    entry.run()
+                entry.done.set()
+                if entry.callback is not None:
+                    entry.callback()
+            if closing:
+                return
+
+    def _run_all(self, entries):
+        # Lets the executor overlap the commands of a batch, as long as it returns one result each.
+        try:
+            results = self.execute_all([entry.args[0] for entry in entries])
+        except Exception as err:
+            for entry in entries:
+                entry.error = err
+            return
+        for entry, result in zip(entries, results):
+            entry.result = result
+
+class _Entry(object):
+
+    __slots__ = ("function", "args", "query", "result", "error", "done", "callback")
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+        self.query = False
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.callback = None
+
+    def run(self):
+        try:
+            self.result = self.function(*self.args)
+        except Exception as err:
+            self.error = err
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def _resolve(future, entry):
+    if future.cancelled():
+        return
+    if entry.error is not None:
+        future.set_exception(entry.error)
+    else:
+        future.set_result(entry.result)
+
+class SequencerError(Exception):
+    pass
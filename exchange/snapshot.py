@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+import gc
+import mmap
+import struct
+
+from orderbook import Order, OrderBook, OrderList
+from orderbook import from_ticks
+
+
+MAGIC = b"KEXS"
+VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+ACCOUNT_ID_INT = 1
+ACCOUNT_ID_BYTES = 32
+
+FILE_HEADER = struct.Struct("<4sHQI")
+SECTION_HEADER = struct.Struct("<Q")
+BOOK_HEADER = struct.Struct("<HI")
+LEVEL_HEADER = struct.Struct("<BHI")
+ORDER_RECORD = struct.Struct(f"<36s{ACCOUNT_ID_BYTES}sBqqqI")
+TRADE_RECORD = struct.Struct("<36s")
+STRING_HEADER = struct.Struct("<H")
+
+
+def dump_snapshot(seq, sections):
+    chunks = [FILE_HEADER.pack(MAGIC, VERSION, seq, len(sections))]
+    for section in sections:
+        chunks.append(SECTION_HEADER.pack(len(section)))
+        chunks.append(section)
+    return b"".join(chunks)
+
+def load_snapshot(buffer):
+    buffer = memoryview(buffer)
+    magic, version, seq, count = FILE_HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise SnapshotError("Not an order book snapshot.")
+    if version != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}.")
+    offset = FILE_HEADER.size
+    books = []
+    # Rebuilding a book allocates millions of objects and none of them are garbage, so
+    # skip the generational collections that would otherwise keep rescanning them.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(count):
+            length, = SECTION_HEADER.unpack_from(buffer, offset)
+            offset += SECTION_HEADER.size
+            books.append(load_book(buffer[offset:offset + length]))
+            offset += length
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return seq, books
+
+def load_snapshot_file(file_name):
+    with open(file_name, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            view = memoryview(buffer)
+            try:
+                return load_snapshot(view)
+            finally:
+                view.release()
+
+def dump_book(orderbook):
+    return encode_book(copy_book(orderbook))
+
+def copy_book(orderbook):
+    # Resting orders only ever change quantity and gain trades, so capturing those two per order is
+    # enough for encode_book to run on another thread while the engine keeps matching.
+    levels = []
+    for is_bid, price_levels in ((True, orderbook.bids), (False, orderbook.asks)):
+        for price, order_list in price_levels.items():
+            levels.append((is_bid, price, [(order, order.quantity, len(order.trades)) for order in order_list]))
+    price_band = [from_ticks(ticks, orderbook.tick_size) for ticks in orderbook.price_band or ()]
+    return orderbook.symbol, orderbook.tick_size, price_band, levels
+
+def encode_book(book_copy):
+    symbol, tick_size, price_band, levels = book_copy
+    chunks = [
+        _pack_string(symbol),
+        _pack_string("" if tick_size is None else str(tick_size)),
+        _pack_string(" ".join(str(price) for price in price_band)),
+        BOOK_HEADER.pack(VERSION, len(levels))
+    ]
+    trades = []
+    for is_bid, price, orders in levels:
+        price_string = str(price).encode()
+        chunks.append(LEVEL_HEADER.pack(is_bid, len(price_string), len(orders)))
+        chunks.append(price_string)
+        for order, quantity, trade_count in orders:
+            chunks.append(_pack_order(order, quantity, trade_count))
+            trades.extend(order.trades[:trade_count])
+    chunks.extend(TRADE_RECORD.pack(trade_id.encode()) for trade_id in trades)
+    return b"".join(chunks)
+
+def load_book(buffer):
+    offset = 0
+    symbol, offset = _unpack_string(buffer, offset)
+    tick_size, offset = _unpack_string(buffer, offset)
+    price_band, offset = _unpack_string(buffer, offset)
+    version, level_count = BOOK_HEADER.unpack_from(buffer, offset)
+    if version != VERSION:
+        raise SnapshotError(f"Unsupported order book version {version}.")
+    offset += BOOK_HEADER.size
+    orderbook = OrderBook(symbol, tick_size or None, price_band.split() or None)
+    parse_price = int if orderbook.tick_size is not None else Decimal
+    tick_size, index, new_order = orderbook.tick_size, orderbook.orders, Order.__new__
+    last_timestamp, last_datetime = None, None
+    trade_counts = []
+    for _ in range(level_count):
+        is_bid, price_length, order_count = LEVEL_HEADER.unpack_from(buffer, offset)
+        offset += LEVEL_HEADER.size
+        price = parse_price(bytes(buffer[offset:offset + price_length]).decode())
+        offset += price_length
+        side = "BUY" if is_bid else "SELL"
+        order_list = OrderList(side, price)
+        end = offset + order_count * ORDER_RECORD.size
+        orders = order_list.orders
+        for order_id, account_id, flags, timestamp, initial_quantity, quantity, trade_count in \
+                ORDER_RECORD.iter_unpack(buffer[offset:end]):
+            order = new_order(Order)
+            order.order_id = order_id = order_id.rstrip(b"\0").decode()
+            order.account_id = account_id.rstrip(b"\0").decode()
+            if flags & ACCOUNT_ID_INT:
+                order.account_id = int(order.account_id)
+            order.side = side
+            order.order_type = "LIMIT"
+            order.symbol = symbol
+            order.price = price
+            if timestamp != last_timestamp:
+                last_timestamp, last_datetime = timestamp, EPOCH + timedelta(microseconds=timestamp)
+            order.timestamp = last_datetime
+            order.initial_quantity = initial_quantity
+            order.quantity = quantity
+            order.trades = []
+            order.tick_size = tick_size
+            orders[order_id] = order
+            index[order_id] = order
+            order_list.volume += quantity
+            if trade_count:
+                trade_counts.append((order, trade_count))
+        order_list.length = order_count
+        offset = end
+        orderbook.side_mapping[side][price] = order_list
+        if is_bid:
+            orderbook.bid_volume += order_list.volume
+        else:
+            orderbook.ask_volume += order_list.volume
+    trade_ids = TRADE_RECORD.iter_unpack(buffer[offset:])
+    for order, trade_count in trade_counts:
+        order.trades = [next(trade_ids)[0].rstrip(b"\0").decode() for _ in range(trade_count)]
+    return orderbook
+
+def _pack_string(value):
+    value = value.encode()
+    return STRING_HEADER.pack(len(value)) + value
+
+def _unpack_string(buffer, offset):
+    length, = STRING_HEADER.unpack_from(buffer, offset)
+    offset += STRING_HEADER.size
+    return bytes(buffer[offset:offset + length]).decode(), offset + length
+
+def _pack_order(order, quantity, trade_count):
+    flags = 0
+    account_id = order.account_id
+    if isinstance(account_id, int):
+        flags |= ACCOUNT_ID_INT
+        account_id = str(account_id)
+    order_id, account_id = order.order_id.encode(), account_id.encode()
+    if len(order_id) > 36 or len(account_id) > ACCOUNT_ID_BYTES:
+        raise SnapshotError(f"Order {order.order_id} has an ID too long for a snapshot record.")
+    timestamp = (order.timestamp - EPOCH) // timedelta(microseconds=1)
+    try:
+        return ORDER_RECORD.pack(order_id, account_id, flags, timestamp, order.initial_quantity,
+                                 quantity, trade_count)
+    except struct.error as err:
+        raise SnapshotError(f"Order {order.order_id} can not be stored in a snapshot: {err}")
+
+class SnapshotError(Exception):
+    pass
@@ -1,21 +1,23 @@
 import random
 
 
-def create_random_quote(symbol, price_floor, price_ceiling):
+def create_random_quote(symbol, price_floor, price_ceiling, market_ratio=0.5, rng=random):
 	side_mapping = {0: "BUY", 1: "SELL"}
-	type_mapping = {0: "LIMIT", 1: "MARKET"}
-	order_type = type_mapping[random.randint(0,1)]
+	order_type = "LIMIT"
+	if rng.random() < market_ratio:
+		order_type = "MARKET"
 	price = None
 	if order_type == "LIMIT":
-		price = round(random.randint(price_floor, price_ceiling - 1) + random.random(), 2)
+		price = round(rng.randint(price_floor, price_ceiling - 1) + rng.random(), 2)
 	random_quote = {
-		"account_id": random.randint(1,100000),
-		"side": side_mapping[random.randint(0,1)],
+		"account_id": rng.randint(1,100000),
+		"side": side_mapping[rng.randint(0,1)],
 		"order_type": order_type,
 		"symbol": symbol,
 		"price": price,
-		"quantity": random.randint(1,100)
+		"quantity": rng.randint(1,100)
 	}
 	return random_quote
 
-print(create_random_quote("KEQ", 50, 55))
+if __name__ == "__main__":
+	print(create_random_quote("KEQ", 50, 55))
@@ -1,9 +1,38 @@
+import asyncio
+from datetime import datetime, timedelta
 from decimal import Decimal
+import io
 import json
+import os
+import pickle
 import requests
+import shutil
+import tempfile
+import threading
 import unittest
+from unittest import mock
 
-from orderbook import Order, OrderList, OrderBook, Trade
+from pymongo import ReplaceOne
+from pymongo.errors import AutoReconnect
+
+import async_server
+from cache import LRUCache
+import exchange
+from feed import MarketDataFeed
+import gateway
+from orderbook import Order, OrderList, OrderBook, PriceLadder, PriceLevels, Trade
+from orderbook import MarketError, OrderError, PriceError
+from registry import OrderBookRegistry, ShardedOrderBookRegistry
+from risk import RiskEngine, RiskError
+from sequencer import Sequencer, SequencerError
+import replay
+import benchmark
+import results
+import loadtest
+import protocol
+from journal import Journal, SnapshotWriter
+from snapshot import SnapshotError, copy_book, dump_book, dump_snapshot, encode_book, load_snapshot, load_snapshot_file
+from writer import BulkWriter, WriterError
 
 
 with open("test_quotes.json") as f:
@@ -47,6 +76,12 @@ class test_trade(unittest.TestCase):
 		self.assertEqual(self.trade.symbol, 'KEQ')
 		self.assertEqual(self.trade.quantity, 75)
 
+	def test_to_dict(self):
+		trade = self.trade.to_dict()
+		self.assertEqual(trade["buyer"], [self.order2.account_id])
+		self.assertEqual(trade["seller"], [self.order.account_id])
+		self.assertEqual(json.loads(self.trade.json()), trade)
+
 class test_order_list(unittest.TestCase):
 
 	def setUp(self):
@@ -63,7 +98,8 @@ class test_order_list(unittest.TestCase):
 	def test_add_order(self):
 		self.assertEqual(len(self.buyOrderList), 2)
 		self.assertEqual(len(self.sellOrderList), 2)
-		self.assertTrue(self.buyOrderList.orders[0].timestamp < self.buyOrderList.orders[1].timestamp)
+		buy_orders = list(self.buyOrderList)
+		self.assertTrue(buy_orders[0].timestamp < buy_orders[1].timestamp)
 		self.assertEqual(self.buyOrderList.volume, 150)
 		self.assertEqual(self.sellOrderList.volume, 125)
 
@@ -75,6 +111,76 @@ class test_order_list(unittest.TestCase):
 		self.assertEqual(self.buyOrderList.volume, 100)
 		self.assertEqual(self.sellOrderList.volume, 75)
 
+	def test_remove_missing_order(self):
+		self.buyOrderList.remove_order(self.orders[0])
+		with self.assertRaises(OrderError):
+			self.buyOrderList.remove_order(self.orders[0])
+		self.assertEqual(len(self.buyOrderList), 1)
+
+	def test_pop_order(self):
+		self.assertEqual(self.buyOrderList.head(), self.orders[0])
+		self.assertEqual(self.buyOrderList.pop_order(), self.orders[0])
+		self.assertEqual(self.buyOrderList.head(), self.orders[2])
+		self.assertEqual(len(self.buyOrderList), 1)
+		self.assertEqual(self.buyOrderList.volume, 100)
+
+class test_price_levels(unittest.TestCase):
+
+	def setUp(self):
+		self.bids = PriceLevels("BUY")
+		self.asks = PriceLevels("SELL")
+		for price in [Decimal("99.5"), Decimal("101"), Decimal("100")]:
+			self.bids[price] = OrderList("BUY", price)
+			self.asks[price] = OrderList("SELL", price)
+
+	def test_best(self):
+		self.assertEqual(self.bids.best(), Decimal("101"))
+		self.assertEqual(self.asks.best(), Decimal("99.5"))
+		self.assertEqual(PriceLevels("BUY").best(), None)
+
+	def test_priority_order(self):
+		self.assertEqual(list(self.bids), [Decimal("101"), Decimal("100"), Decimal("99.5")])
+		self.assertEqual(list(self.asks), [Decimal("99.5"), Decimal("100"), Decimal("101")])
+
+	def test_remove_level(self):
+		del self.bids[Decimal("101")]
+		del self.asks[Decimal("99.5")]
+		self.assertEqual(self.bids.best(), Decimal("100"))
+		self.assertEqual(self.asks.best(), Decimal("100"))
+		self.assertEqual(len(self.bids), 2)
+		self.assertFalse(Decimal("101") in self.bids)
+
+class test_price_ladder(unittest.TestCase):
+
+	def setUp(self):
+		self.bids = PriceLadder("BUY", 9900, 10100)
+		self.asks = PriceLadder("SELL", 9900, 10100)
+		for price in [9950, 10100, 10000]:
+			self.bids[price] = OrderList("BUY", price)
+			self.asks[price] = OrderList("SELL", price)
+
+	def test_best(self):
+		self.assertEqual(self.bids.best(), 10100)
+		self.assertEqual(self.asks.best(), 9950)
+		self.assertEqual(PriceLadder("SELL", 1, 10).best(), None)
+
+	def test_priority_order(self):
+		self.assertEqual(list(self.bids), [10100, 10000, 9950])
+		self.assertEqual(list(self.asks), [9950, 10000, 10100])
+
+	def test_remove_level(self):
+		del self.bids[10100]
+		del self.asks[9950]
+		self.assertEqual(self.bids.best(), 10000)
+		self.assertEqual(self.asks.best(), 10000)
+		self.assertEqual(len(self.bids), 2)
+		self.assertFalse(10100 in self.bids)
+
+	def test_out_of_band(self):
+		self.assertFalse(20000 in self.bids)
+		with self.assertRaises(PriceError):
+			self.bids[20000] = OrderList("BUY", 20000)
+
 class test_order_book(unittest.TestCase):
 
 	def setUp(self):
@@ -86,11 +192,11 @@ class test_order_book(unittest.TestCase):
 			quote = test_quotes[str(i)]
 			if "price" in quote:
 				quote["price"] = Decimal(quote["price"])
-			order = json.loads(self.order_book.process_order(quote))
-			self.orders.append(order)
-			for trades in self.order_book.completed_trades:
+			report = self.order_book.process_order(quote)
+			self.orders.append(report.order.to_dict())
+			for trades in report.trades:
 				self.completed_trades.append(trades)
-			for orders in self.order_book.completed_orders:
+			for orders in report.completed_orders:
 				self.completed_orders.append(orders)
 
 	def test_get_min_ask(self):
@@ -106,20 +212,1004 @@ class test_order_book(unittest.TestCase):
 		self.assertEqual(len(self.order_book.ongoing_orders), 3)
 		self.assertEqual(len(self.completed_orders), 6)
 
+	def test_level_volume(self):
+		for price, order_list in self.order_book.asks.items():
+			self.assertEqual(order_list.volume, sum(order.quantity for order in order_list))
+		for price, order_list in self.order_book.bids.items():
+			self.assertEqual(order_list.volume, sum(order.quantity for order in order_list))
+
+	def test_side_volume(self):
+		self.assertEqual(self.order_book.bid_volume, sum(order_list.volume for order_list in self.order_book.bids.values()))
+		self.assertEqual(self.order_book.ask_volume, sum(order_list.volume for order_list in self.order_book.asks.values()))
+		order = [order for order in self.order_book.orders.values() if not order.trades][0]
+		order_id = order.order_id
+		ask_volume = self.order_book.ask_volume
+		bid_volume = self.order_book.bid_volume
+		self.order_book.cancel_order(order_id)
+		if order.side == "BUY":
+			self.assertEqual(self.order_book.bid_volume, bid_volume - order.quantity)
+		else:
+			self.assertEqual(self.order_book.ask_volume, ask_volume - order.quantity)
+
+	def test_process_orders(self):
+		quotes = [dict(test_quotes[str(i)], price=Decimal(str(test_quotes[str(i)]["price"]))) for i in (1, 2, 10)]
+		quotes.append(dict(test_quotes["7"], quantity=10000))
+		report = self.order_book.process_orders(quotes)
+		results = report.results
+		self.assertEqual(len(results), 4)
+		self.assertTrue(isinstance(results[3], MarketError))
+		self.assertEqual(Decimal(results[2].to_dict()["price"]), Decimal("75"))
+		self.assertEqual(len(report.trades), 1)
+		self.assertEqual(results[0].quantity, 5)
+		self.assertTrue(results[2].order_id in self.order_book.orders)
+
+	def test_deep_sweep(self):
+		order_book = OrderBook("KEQ")
+		for level in range(3000):
+			order_book.process_order(dict(test_quotes["2"], price=Decimal(100) + level, quantity=1))
+		report = order_book.process_order(dict(test_quotes["7"], quantity=2999))
+		self.assertEqual(report.order.quantity, 0)
+		self.assertEqual(len(report.trades), 2999)
+		self.assertEqual(order_book.get_min_ask(), Decimal(3099))
+		self.assertEqual(order_book.ask_volume, 1)
+
+	def test_deterministic_ids(self):
+		order_books = [OrderBook("KEQ"), OrderBook("KEQ")]
+		timestamp = datetime(2018, 5, 17, 15, 37)
+		reports = []
+		for order_book in order_books:
+			for i in range(1, 10):
+				quote = dict(test_quotes[str(i)])
+				report = order_book.process_order(quote, f"00000000-0000-0000-0000-{i:012d}", timestamp)
+			reports.append(report)
+		self.assertEqual(list(reports[0].trades), list(reports[1].trades))
+		self.assertEqual(order_books[0].ongoing_orders, order_books[1].ongoing_orders)
+
 	def test_modify_order(self):
 		quote = test_quotes[str(10)]
 		if "price" in quote:
 			quote["price"] = Decimal(quote["price"])
-		new_order = json.loads(self.order_book.modify_order(self.orders[8]["order_id"], quote))
+		report = self.order_book.modify_order(self.orders[8]["order_id"], quote)
+		new_order = report.order.to_dict()
 		self.assertEqual(new_order["price"], '75')
+		self.assertEqual(report.changed_orders.pop(self.orders[8]["order_id"]), None)
+		self.assertEqual(list(report.changed_orders), [new_order["order_id"]])
+		self.assertEqual([execution.event for execution in report.executions], ["CANCEL", "REST"])
+		with self.assertRaises(OrderError) as context:
+			self.order_book.modify_order(self.orders[8]["order_id"], quote)
+		self.assertFalse(hasattr(context.exception, "report"))
+		market = dict(test_quotes["7"], quantity=10000)
+		with self.assertRaises(MarketError) as context:
+			self.order_book.modify_order(new_order["order_id"], market)
+		self.assertEqual(context.exception.report.changed_orders, {new_order["order_id"]: None})
+		self.assertIsNone(context.exception.report.order)
+
+	def test_order_index(self):
+		resting_ids = set()
+		for price_levels in (self.order_book.bids, self.order_book.asks):
+			for order_list in price_levels.values():
+				resting_ids.update(order.order_id for order in order_list)
+		self.assertEqual(set(self.order_book.orders), resting_ids)
+		self.assertEqual(set(self.order_book.ongoing_orders), resting_ids)
 
 	def test_cancel_order(self):
 		quote = test_quotes[str(10)]
 		if "price" in quote:
 			quote["price"] = Decimal(quote["price"])
-		new_order = json.loads(self.order_book.process_order(quote))
-		self.order_book.cancel_order(new_order["order_id"])
+		new_order = self.order_book.process_order(quote).order.to_dict()
+		report = self.order_book.cancel_order(new_order["order_id"])
 		self.assertEqual(len(self.order_book.bids.keys()), 1)
+		self.assertFalse(new_order["order_id"] in self.order_book.orders)
+		self.assertEqual(report.changed_orders, {new_order["order_id"]: None})
+		self.assertEqual(report.completed_orders, {})
+		self.assertEqual(report.order.order_id, new_order["order_id"])
+		with self.assertRaises(OrderError):
+			self.order_book.cancel_order(new_order["order_id"])
+
+	def test_changed_orders(self):
+		quote = {"account_id": "1", "side": "SELL", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(200), "quantity": 10}
+		report = self.order_book.process_order(quote)
+		resting = report.order
+		self.assertEqual(report.changed_orders, {resting.order_id: resting})
+		quote = {"account_id": "2", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(200), "quantity": sum(self.order_book.depth()[1].values()) - 4}
+		report = self.order_book.process_order(quote)
+		sweeper = report.order
+		changed_orders = report.changed_orders
+		self.assertEqual(changed_orders.pop(resting.order_id), resting)
+		self.assertEqual(resting.quantity, 4)
+		self.assertNotIn(sweeper.order_id, changed_orders)
+		self.assertTrue(changed_orders)
+		self.assertTrue(all(order is None for order in changed_orders.values()))
+		self.assertEqual(set(changed_orders), set(report.completed_orders) - {sweeper.order_id})
+		self.assertEqual(list(self.order_book.orders.values())[-1], resting)
+
+	def test_execution_report(self):
+		quote = {"account_id": "2", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(100), "quantity": 50}
+		report = self.order_book.process_order(quote)
+		self.assertEqual([execution.event for execution in report.executions], ["FILL", "REST"])
+		fill, rest = report.to_dict()["executions"]
+		self.assertEqual((fill["price"], fill["quantity"]), ("99.5", "45"))
+		self.assertEqual(fill["trade_id"], report.fills()[0].trade.trade_id)
+		self.assertEqual((rest["order_id"], rest["price"], rest["quantity"]), (report.order.order_id, "100", "5"))
+		self.assertEqual(list(report.trades), [fill["trade_id"]])
+
+	def test_level_changes(self):
+		asks = self.order_book.depth()[1]
+		quote = {"account_id": "1", "side": "SELL", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(200), "quantity": 10}
+		report = self.order_book.process_order(quote)
+		self.assertEqual(report.levels, ({}, {Decimal(200): asks.get(Decimal(200), 0) + 10}))
+		quote = {"account_id": "2", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(200), "quantity": sum(asks.values()) + 10}
+		report = self.order_book.process_order(quote)
+		self.assertEqual(report.levels, ({}, dict.fromkeys(set(asks) | {Decimal(200)}, 0)))
+		quote = dict(quote, price=Decimal("1.5"), quantity=5)
+		order = self.order_book.process_order(quote).order
+		self.assertEqual(self.order_book.cancel_order(order.order_id).levels, ({Decimal("1.5"): 0}, {}))
+
+	def test_level_keys(self):
+		order_book = OrderBook("ABC")
+		quote = {"account_id": "1", "side": "BUY", "order_type": "LIMIT", "symbol": "ABC",
+				 "price": Decimal("100.50"), "quantity": 5}
+		order_book.process_order(quote)
+		report = order_book.process_order(dict(quote, price=Decimal("100.5")))
+		self.assertEqual([str(price) for price in report.levels[0]], [str(price) for price in order_book.depth()[0]])
+		report = order_book.cancel_order(report.order.order_id)
+		self.assertEqual([str(price) for price in report.levels[0]], ["100.50"])
+
+class test_tick_order_book(unittest.TestCase):
+
+	def setUp(self):
+		self.completed_trades = []
+		self.order_book = OrderBook("KEQ", "0.01", ("50", "150"))
+		for i in range(1, 10):
+			quote = dict(test_quotes[str(i)])
+			if "price" in quote:
+				quote["price"] = Decimal(str(quote["price"]))
+			self.completed_trades.extend(self.order_book.process_order(quote).trades.values())
+
+	def test_best_prices(self):
+		self.assertEqual(self.order_book.get_min_ask(), 9950)
+		self.assertEqual(self.order_book.get_max_bid(), 9900)
+		self.assertEqual(self.order_book.to_price(self.order_book.get_min_ask()), Decimal("99.5"))
+
+	def test_process_order(self):
+		self.assertEqual(len(self.order_book.bids), 1)
+		self.assertEqual(len(self.order_book.asks), 2)
+		self.assertEqual(len(self.completed_trades), 6)
+		self.assertEqual(Decimal(self.completed_trades[0].to_dict()["price"]), Decimal("100.5"))
+
+	def test_price_errors(self):
+		quote = dict(test_quotes["10"], price=Decimal("75.001"))
+		with self.assertRaises(PriceError):
+			self.order_book.process_order(quote)
+		quote["price"] = Decimal("200")
+		with self.assertRaises(PriceError):
+			self.order_book.process_order(quote)
+
+	def test_check_quote(self):
+		with mock.patch.object(exchange, "TICK_SIZE", 0.01):
+			self.assertEqual(exchange.check_quote(dict(test_quotes["10"], price=Decimal("75.07"))), (True, []))
+			self.assertEqual(exchange.check_quote(dict(test_quotes["10"], price=Decimal("75.075")))[1],
+							 [{"PRICE_ERROR": "Price must be a multiple of the tick size."}])
+
+class _stored_books(object):
+
+	def __init__(self, documents):
+		self.documents = documents
+
+	def find(self, query):
+		return _cursor(document for document in self.documents
+					   if all(document.get(key) == value for key, value in query.items()))
+
+class _cursor(list):
+
+	def limit(self, count):
+		return _cursor(self[:count])
+
+	def count(self):
+		return len(self)
+
+class test_load_orderbook(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.order_book = OrderBook("KEQ")
+		self.order_book.process_order(dict(test_quotes["10"], price=Decimal("75")))
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def _load(self, documents, symbol="KEQ"):
+		with mock.patch.object(exchange, "db", mock.Mock(orderbook=_stored_books(documents)), create=True), \
+				mock.patch.object(exchange, "ORDERBOOK_FILE", os.path.join(self.directory, "orderbook_{symbol}.pickle")), \
+				mock.patch.object(exchange, "LEGACY_ORDERBOOK_FILE", os.path.join(self.directory, "orderbook.pickle")):
+			return exchange._load_orderbook(symbol)
+
+	def test_legacy_document(self):
+		documents = [{"orderbook_id": 1, "orderbook": pickle.dumps(self.order_book)}]
+		self.assertEqual(self._load(documents).ongoing_orders, self.order_book.ongoing_orders)
+		self.assertIsNone(self._load(documents, "KEX"))
+		self.assertIsNone(self._load([]))
+
+	def test_symbol_document_first(self):
+		documents = [{"orderbook_id": 1, "orderbook": pickle.dumps(OrderBook("KEQ"))},
+					 {"symbol": "KEQ", "orderbook": pickle.dumps(self.order_book)}]
+		self.assertEqual(self._load(documents).ongoing_orders, self.order_book.ongoing_orders)
+
+class test_registry(unittest.TestCase):
+
+	def setUp(self):
+		self.registry = OrderBookRegistry(["KEQ", "KEX"])
+
+	def test_get(self):
+		self.assertEqual(self.registry.get("KEQ").symbol, "KEQ")
+		self.assertTrue(self.registry.get("KEX") is self.registry.get("KEX"))
+		with self.assertRaises(OrderError):
+			self.registry.get("XYZ")
+
+	def test_find(self):
+		quote = dict(test_quotes["10"], symbol="KEX", price=Decimal("75"))
+		report = self.registry.get("KEX").process_order(quote)
+		self.registry.update("KEX", report.changed_orders)
+		self.assertEqual(self.registry.find(report.order.order_id).symbol, "KEX")
+		self.assertEqual(len(self.registry.get("KEQ").orders), 0)
+		with self.assertRaises(OrderError):
+			self.registry.find("missing")
+		restored = OrderBookRegistry(["KEQ", "KEX"], books=[self.registry.get("KEX")])
+		self.assertEqual(restored.find(report.order.order_id).symbol, "KEX")
+		self.registry.update("KEX", self.registry.get("KEX").cancel_order(report.order.order_id).changed_orders)
+		with self.assertRaises(OrderError):
+			self.registry.find(report.order.order_id)
+
+class test_sharded_registry(unittest.TestCase):
+
+	def setUp(self):
+		self.registry = ShardedOrderBookRegistry(["KEQ", "KEX", "KEY"], 2, pins={"KEQ": 0, "KEX": 1})
+
+	def tearDown(self):
+		self.registry.close()
+
+	def test_shard_for(self):
+		self.assertEqual(self.registry.shard_for("KEQ"), 0)
+		self.assertEqual(self.registry.shard_for("KEX"), 1)
+
+	def test_remote_orders(self):
+		orderbook = self.registry.get("KEX")
+		resting = orderbook.process_order(dict(test_quotes["10"], symbol="KEX", price=Decimal("75")))
+		self.registry.update("KEX", resting.changed_orders)
+		report = orderbook.process_order(dict(test_quotes["7"], symbol="KEX", side="SELL", quantity=40))
+		self.assertEqual(report.order.quantity, 0)
+		self.assertEqual(len(report.trades), 1)
+		self.assertEqual([execution.event for execution in report.executions], ["FILL"])
+		self.assertEqual(orderbook.get_max_bid(), Decimal("75"))
+		self.assertEqual(self.registry.find(resting.order.order_id).symbol, "KEX")
+		with self.assertRaises(MarketError):
+			self.registry.get("KEQ").process_order(dict(test_quotes["7"]))
+
+	def test_dispatch(self):
+		books = [self.registry.get(symbol) for symbol in ("KEQ", "KEX")]
+		replies = [self.registry.dispatch(orderbook, "process_order",
+										  (dict(test_quotes["10"], symbol=orderbook.symbol, price=Decimal("75")),))
+				   for orderbook in books]
+		self.assertEqual([reply.result().order.symbol for reply in replies], ["KEQ", "KEX"])
+		self.assertEqual(books[1].get_max_bid(), Decimal("75"))
+		self.assertEqual(books[1].bid_volume, books[1].depth()[2])
+		with self.assertRaises(OrderError):
+			self.registry.dispatch(books[0], "cancel_order", ("missing",)).result()
+
+	def test_copy(self):
+		orderbook = self.registry.get("KEX")
+		orderbook.process_order(dict(test_quotes["10"], symbol="KEX", price=Decimal("75")))
+		expected = self.registry.dumps("KEX")
+		book_copy = self.registry.copy("KEX")
+		orderbook.process_order(dict(test_quotes["7"], symbol="KEX", side="SELL", quantity=40))
+		self.assertEqual(self.registry.encode(book_copy), expected)
+
+class test_lru_cache(unittest.TestCase):
+
+	def test_eviction(self):
+		cache = LRUCache(2)
+		cache.put("a", 1)
+		cache.put("b", 2)
+		self.assertEqual(cache.get("a"), 1)
+		cache.put("c", 3)
+		self.assertNotIn("b", cache)
+		self.assertEqual(cache.get("b"), None)
+		self.assertEqual([cache.get("a"), cache.get("c")], [1, 3])
+		self.assertEqual(cache.stats(), {"size": 2, "capacity": 2, "hits": 3, "misses": 1})
+
+class test_sequencer(unittest.TestCase):
+
+	def setUp(self):
+		self.release = threading.Event()
+		self.executed = []
+		self.batches = []
+
+	def _execute(self, command):
+		if command == "block":
+			self.release.wait()
+		if command == "fail":
+			raise OrderError("Command failed.")
+		self.executed.append(command)
+		return command * 2
+
+	def test_ordering_and_batching(self):
+		sequencer = Sequencer(self._execute, self.batches.append)
+		blocker = threading.Thread(target=sequencer.submit, args=("block",))
+		blocker.start()
+		while sequencer.queue.qsize():
+			pass
+		threads = [threading.Thread(target=sequencer.submit, args=(i,)) for i in range(1, 6)]
+		for thread in threads:
+			thread.start()
+		while sequencer.queue.qsize() < 5:
+			pass
+		self.release.set()
+		for thread in threads + [blocker]:
+			thread.join()
+		self.assertEqual(sequencer.submit_all([6, 7]), [12, 14])
+		sequencer.close()
+		self.assertEqual(self.executed[0], "block")
+		self.assertEqual(sorted(self.executed[1:6]), [1, 2, 3, 4, 5])
+		self.assertEqual(self.batches[0], ["blockblock"])
+		self.assertEqual(len(self.batches[1]), 5)
+		self.assertEqual(self.batches[-1], [12, 14])
+		self.assertEqual(sequencer.stats()["commands"], 8)
+		with self.assertRaises(SequencerError):
+			sequencer.submit(8)
+
+	def test_errors(self):
+		def commit(results):
+			if 3 in [result // 2 for result in results]:
+				raise IOError("Flush failed.")
+			self.batches.append(results)
+		sequencer = Sequencer(self._execute, commit)
+		with self.assertRaises(OrderError):
+			sequencer.submit("fail")
+		with self.assertRaises(IOError):
+			sequencer.submit(3)
+		self.assertEqual(sequencer.submit(4), 8)
+		sequencer.close()
+		self.assertEqual(self.batches, [[8]])
+
+	def test_submit_async(self):
+		sequencer = Sequencer(self._execute, self.batches.append)
+		async def submit(*commands):
+			return await asyncio.gather(*[sequencer.submit_async(command) for command in commands])
+		self.assertEqual(asyncio.run(submit(1, 2)), [2, 4])
+		with self.assertRaises(OrderError):
+			asyncio.run(submit("fail"))
+		sequencer.close()
+
+	def test_execute_all(self):
+		sequencer = Sequencer(self._execute, self.batches.append, execute_all=lambda commands: [command * 3 for command in commands])
+		self.assertEqual(sequencer.submit_all([1, 2]), [3, 6])
+		sequencer.close()
+		self.assertEqual(self.executed, [])
+
+	def test_query_after_commit(self):
+		committed = []
+		sequencer = Sequencer(self._execute, committed.extend)
+		self.assertEqual(sequencer.submit(1), 2)
+		self.assertEqual(sequencer.query(list, committed), [2])
+		sequencer.close()
+
+class test_replay(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def _write_log(self, records):
+		log_file = os.path.join(self.directory, "commands.jsonl")
+		with open(log_file, "w") as f:
+			for record in records:
+				f.write(json.dumps(record, default=str) + "\n")
+		return log_file
+
+	def test_deterministic(self):
+		quotes = list(benchmark.random_quotes(300, market_ratio=0.1, seed=3))
+		log_file = self._write_log(quotes)
+		tapes = []
+		for _ in range(2):
+			tape = io.StringIO()
+			registry, results = replay.replay(replay.read_records(log_file), tape=tape)
+			tapes.append(tape.getvalue())
+		self.assertEqual(tapes[0], tapes[1])
+		self.assertEqual(results["commands"], 300)
+		self.assertEqual(len(tapes[0].splitlines()), results["trades"])
+		orderbook = OrderBook("KEQ")
+		for seq, quote in enumerate(quotes, 1):
+			try:
+				orderbook.process_order(quote, replay._replay_id(seq), replay.REPLAY_EPOCH + timedelta(microseconds=seq))
+			except MarketError:
+				pass
+		self.assertEqual(registry.get("KEQ").ongoing_orders, orderbook.ongoing_orders)
+
+	def test_journal(self):
+		journal = Journal(self.directory)
+		quote = {"account_id": "1", "side": "SELL", "order_type": "LIMIT", "symbol": "KEQ", "price": "100.5",
+				 "quantity": 10}
+		journal.append({"command": "new", "quote": quote, "order_id": "a", "timestamp": datetime(2020, 1, 1)})
+		journal.append({"command": "new", "quote": dict(quote, side="BUY", quantity=4), "order_id": "b",
+						"timestamp": datetime(2020, 1, 2)})
+		journal.append({"command": "cancel", "order_id": "b"})
+		journal.close()
+		registry, results = replay.replay(replay.read_records(self.directory))
+		self.assertEqual(results["rejects"], 1)
+		self.assertEqual(results["trades"], 1)
+		self.assertEqual(registry.get("KEQ").get_order("a").quantity, 6)
+		registry, results = replay.replay(replay.read_records(self.directory), after_seq=1)
+		self.assertEqual(results["commands"], 2)
+
+class test_journal(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.journal = Journal(self.directory)
+
+	def tearDown(self):
+		self.journal.close()
+		shutil.rmtree(self.directory)
+
+	def test_append(self):
+		for i in range(5):
+			self.assertEqual(self.journal.append({"command": "cancel", "order_id": str(i)}), i + 1)
+		self.assertEqual([record["order_id"] for record in self.journal.read(after_seq=3)], ["3", "4"])
+		self.journal.close()
+		self.journal = Journal(self.directory)
+		self.assertEqual(self.journal.seq, 5)
+		self.assertEqual(self.journal.append({"command": "cancel", "order_id": "5"}), 6)
+
+	def test_rotate_and_prune(self):
+		for i in range(3):
+			self.journal.append({"order_id": str(i)})
+		self.journal.rotate()
+		self.journal.append({"order_id": "3"})
+		self.assertEqual(len(self.journal.segments()), 2)
+		self.journal.prune(3)
+		self.assertEqual(len(self.journal.segments()), 1)
+		self.assertEqual([record["seq"] for record in self.journal.read()], [4])
+
+	def test_advance(self):
+		self.journal.append({"order_id": "0"})
+		self.journal.advance(10)
+		self.assertEqual(self.journal.append({"order_id": "1"}), 11)
+		self.journal.advance(5)
+		self.assertEqual(self.journal.append({"order_id": "2"}), 12)
+		self.journal.close()
+		self.journal = Journal(self.directory)
+		self.assertEqual(self.journal.seq, 12)
+		self.assertEqual([record["seq"] for record in self.journal.read(after_seq=10)], [11, 12])
+
+	def test_torn_tail(self):
+		self.journal.append({"order_id": "0"})
+		with open(self.journal.segments()[-1], "ab") as f:
+			f.write(b'{"seq": 2, "order')
+		self.assertEqual([record["seq"] for record in self.journal.read()], [1])
+
+	def test_snapshot_writer(self):
+		saved = []
+		snapshots = SnapshotWriter(self.directory, lambda seq, data: saved.append(seq), keep=1)
+		self.assertEqual(snapshots.latest(), (None, None))
+		snapshots.submit(3, b"first")
+		snapshots.wait()
+		snapshots.submit(7, b"second")
+		snapshots.wait()
+		self.assertEqual(snapshots.latest(), (7, b"second"))
+		self.assertEqual(saved, [3, 7])
+		self.assertEqual(len([name for name in os.listdir(self.directory) if name.startswith("snapshot")]), 1)
+
+class test_snapshot(unittest.TestCase):
+
+	def _quote(self, side, price, quantity, account_id="1", order_type="LIMIT"):
+		return {"account_id": account_id, "side": side, "order_type": order_type, "symbol": "KEQ",
+				"price": price, "quantity": quantity}
+
+	def _assert_same_book(self, restored, orderbook):
+		self.assertEqual(restored.ongoing_orders, orderbook.ongoing_orders)
+		self.assertEqual(restored.depth(), orderbook.depth())
+		self.assertEqual(list(restored.bids), list(orderbook.bids))
+		self.assertEqual(list(restored.asks), list(orderbook.asks))
+
+	def test_round_trip(self):
+		orderbook = OrderBook("KEQ")
+		orderbook.process_order(self._quote("SELL", Decimal("100.5"), 10))
+		orderbook.process_order(self._quote("SELL", Decimal("100.5"), 5, account_id=7))
+		orderbook.process_order(self._quote("SELL", Decimal(101), 5))
+		orderbook.process_order(self._quote("BUY", Decimal(99), 5))
+		orderbook.process_order(self._quote("BUY", None, 4, order_type="MARKET"))
+		seq, books = load_snapshot(dump_snapshot(12, [dump_book(orderbook)]))
+		self.assertEqual(seq, 12)
+		self._assert_same_book(books[0], orderbook)
+		partial = books[0].get_order(list(orderbook.asks.values())[0].head().order_id)
+		self.assertEqual(len(partial.trades), 1)
+		self.assertEqual(partial.quantity, 6)
+		self.assertEqual(list(books[0].asks.values())[0].orders.keys(), list(orderbook.asks.values())[0].orders.keys())
+		books[0].process_order(self._quote("BUY", Decimal(101), 16))
+		self.assertIsNone(books[0].get_min_ask())
+
+	def test_copy_book(self):
+		orderbook = OrderBook("KEQ")
+		orderbook.process_order(self._quote("SELL", Decimal("100.5"), 10))
+		orderbook.process_order(self._quote("BUY", Decimal(99), 5))
+		expected = dump_book(orderbook)
+		book_copy = copy_book(orderbook)
+		orderbook.process_order(self._quote("BUY", Decimal("100.5"), 4))
+		orderbook.process_order(self._quote("SELL", Decimal(98), 2))
+		self.assertEqual(encode_book(book_copy), expected)
+		self.assertNotEqual(dump_book(orderbook), expected)
+
+	def test_tick_book(self):
+		orderbook = OrderBook("KEQ", "0.01", ("90", "110"))
+		orderbook.process_order(self._quote("BUY", Decimal("99.99"), 3))
+		orderbook.process_order(self._quote("SELL", Decimal("100.01"), 3))
+		restored = load_snapshot(dump_snapshot(1, [dump_book(orderbook)]))[1][0]
+		self.assertIsInstance(restored.bids, PriceLadder)
+		self.assertEqual(restored.price_band, orderbook.price_band)
+		self._assert_same_book(restored, orderbook)
+
+	def test_load_file(self):
+		directory = tempfile.mkdtemp()
+		try:
+			snapshot_file = os.path.join(directory, "snapshot.bin")
+			orderbook = OrderBook("KEQ")
+			orderbook.process_order(self._quote("BUY", Decimal(99), 5))
+			with open(snapshot_file, "wb") as f:
+				f.write(dump_snapshot(3, [dump_book(orderbook), dump_book(OrderBook("ABC"))]))
+			seq, books = load_snapshot_file(snapshot_file)
+			self.assertEqual([book.symbol for book in books], ["KEQ", "ABC"])
+			self._assert_same_book(books[0], orderbook)
+		finally:
+			shutil.rmtree(directory)
+
+	def test_not_a_snapshot(self):
+		with self.assertRaises(SnapshotError):
+			load_snapshot(b"\x80\x04" + bytes(32))
+
+class _recording_db(object):
+
+	def __init__(self, failures=0):
+		self.batches = []
+		self.upserts = []
+		self.failures = failures
+		self.gate = threading.Event()
+		self.gate.set()
+
+	def __getitem__(self, collection):
+		return _recording_collection(self, collection)
+
+class _recording_collection(object):
+
+	def __init__(self, db, name):
+		self.db = db
+		self.name = name
+
+	def insert_many(self, documents, ordered=True):
+		self.db.gate.wait()
+		if self.db.failures:
+			self.db.failures -= 1
+			raise AutoReconnect("connection refused")
+		self.db.batches.append((self.name, [document["id"] for document in documents]))
+
+	def bulk_write(self, requests, ordered=True):
+		self.db.gate.wait()
+		self.db.upserts.append((self.name, requests))
+
+class test_bulk_writer(unittest.TestCase):
+
+	def test_batches(self):
+		db = _recording_db()
+		writer = BulkWriter(db, batch_size=3, flush_interval=0.05)
+		db.gate.clear()
+		for i in range(7):
+			writer.put("orders" if i % 2 else "trades", {"id": i})
+		db.gate.set()
+		self.assertTrue(writer.flush(5))
+		writer.close()
+		self.assertEqual(sorted(i for name, ids in db.batches for i in ids), list(range(7)))
+		self.assertTrue(all(len(ids) <= 3 for name, ids in db.batches))
+		self.assertEqual(writer.stats()["documents"], 7)
+		self.assertEqual(writer.stats()["queue_depth"], 0)
+
+	def test_flush_interval(self):
+		db = _recording_db()
+		writer = BulkWriter(db, batch_size=100, flush_interval=0.01)
+		writer.put("orders", {"id": 1})
+		self.assertTrue(writer.flush(5))
+		self.assertEqual(db.batches, [("orders", [1])])
+		writer.close()
+
+	def test_backpressure(self):
+		db = _recording_db()
+		db.gate.clear()
+		writer = BulkWriter(db, batch_size=1, flush_interval=0, max_queue=2)
+		putter = threading.Thread(target=lambda: [writer.put("orders", {"id": i}) for i in range(5)])
+		putter.start()
+		putter.join(0.2)
+		self.assertTrue(putter.is_alive())
+		db.gate.set()
+		putter.join(5)
+		writer.close()
+		self.assertGreater(writer.stats()["blocked_puts"], 0)
+		self.assertEqual([ids for name, ids in db.batches], [[0], [1], [2], [3], [4]])
+
+	def test_retry_and_close(self):
+		db = _recording_db(failures=2)
+		writer = BulkWriter(db, flush_interval=0, retry_interval=0.01)
+		writer.put("trades", {"id": 1})
+		writer.close()
+		self.assertEqual(db.batches, [("trades", [1])])
+		self.assertEqual(writer.stats()["errors"], 2)
+		with self.assertRaises(WriterError):
+			writer.put("trades", {"id": 2})
+
+	def test_keyed_put(self):
+		db = _recording_db()
+		writer = BulkWriter(db, flush_interval=0)
+		writer.put("orders", {"order_id": "a", "id": 1}, "order_id")
+		writer.put("orders", {"id": 2})
+		writer.close()
+		self.assertEqual(db.batches, [("orders", [2])])
+		self.assertEqual(db.upserts, [("orders", [ReplaceOne({"order_id": "a"}, {"order_id": "a", "id": 1}, upsert=True)])])
+
+	def test_requeue_fills(self):
+		orderbook = OrderBook("ABC")
+		orderbook.process_order({"side": "SELL", "order_type": "LIMIT", "quantity": 5, "price": Decimal(10),
+		                         "account_id": "a", "symbol": "ABC"}, "ask", datetime(2020, 1, 1))
+		report = orderbook.process_order({"side": "BUY", "order_type": "LIMIT", "quantity": 5, "price": Decimal(10),
+		                                  "account_id": "b", "symbol": "ABC"}, "bid", datetime(2020, 1, 1))
+		writer = mock.Mock()
+		with mock.patch.object(exchange, "writer", writer, create=True):
+			exchange._requeue_fills(report)
+		puts = [(name, document.get("order_id") or document["trade_id"], key)
+		        for (name, document, key), kwargs in writer.put.call_args_list]
+		self.assertEqual(sorted(puts), sorted([("orders", "ask", "order_id"), ("orders", "bid", "order_id")] +
+		                                      [("trades", trade_id, "trade_id") for trade_id in report.trades]))
+		self.assertEqual(exchange.completed_cache.get("bid")["order_id"], "bid")
+
+	def test_lookup_timeout(self):
+		db = _recording_db()
+		db.gate.clear()
+		writer = BulkWriter(db, flush_interval=0)
+		writer.put("trades", {"id": 1})
+		with mock.patch.object(exchange, "writer", writer, create=True), \
+				mock.patch.object(exchange, "WRITER_FLUSH_TIMEOUT", 0.05):
+			response = exchange.app.test_client().post("/v1/trade/details", json={"trade_id": "missing"})
+		self.assertIn("MONGODB_ERROR", json.loads(response.data)["errors"][0])
+		db.gate.set()
+		writer.close()
+
+class test_benchmark(unittest.TestCase):
+
+	def test_random_quotes(self):
+		quotes = list(benchmark.random_quotes(100, market_ratio=0, seed=7))
+		self.assertEqual(quotes, list(benchmark.random_quotes(100, market_ratio=0, seed=7)))
+		self.assertTrue(all(quote["order_type"] == "LIMIT" for quote in quotes))
+		self.assertTrue(all(50 <= quote["price"] < 55 for quote in quotes))
+
+	def test_stream(self):
+		options, results = benchmark.run_scenario("stream", {"orders": 500, "depth": 50})
+		self.assertEqual(options["orders"], 500)
+		self.assertEqual(results["commands"], 500)
+		self.assertTrue(results["p50_us"] <= results["p99_us"] <= results["p999_us"])
+
+	def test_restart(self):
+		options, results = benchmark.run_scenario("restart", {"resting_orders": 200, "levels": 20})
+		self.assertEqual(results["resting_orders"], 200)
+		self.assertLess(results["snapshot_bytes"], results["pickle_bytes"])
+
+	def test_report_results(self):
+		directory = tempfile.mkdtemp()
+		try:
+			output = os.path.join(directory, "results.jsonl")
+			with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+				results.report_results("stream", {"commands": 3, "p50_us": 1.5}, output, scenario="stream")
+				results.report_results("stream", {"commands": 4, "p50_us": 2.25}, output, scenario="stream")
+			self.assertEqual(stdout.getvalue().splitlines()[0], "stream: commands=3, p50_us=1.50")
+			with open(output) as f:
+				records = [json.loads(line) for line in f]
+			self.assertEqual([record["results"]["commands"] for record in records], [3, 4])
+			self.assertEqual(records[0]["scenario"], "stream")
+		finally:
+			shutil.rmtree(directory)
+
+class test_protocol(unittest.TestCase):
+
+	def _decode(self, message):
+		length, message_type = protocol.FRAME_HEADER.unpack_from(message)
+		self.assertEqual(length, len(message) - 2)
+		return protocol.decode(message_type, message[protocol.FRAME_HEADER.size:])
+
+	def test_orders(self):
+		quote = {"symbol": "KEQ", "side": "BUY", "order_type": "LIMIT", "price": Decimal("99.25"), "quantity": 10,
+				 "account_id": "12"}
+		self.assertEqual(self._decode(protocol.encode_new_order(7, quote)), {"client_ref": 7, "quote": quote})
+		market = dict(quote, order_type="MARKET", price=None)
+		self.assertNotIn("price", self._decode(protocol.encode_new_order(8, market))["quote"])
+		order_id = "9f4a6c1e-3b2d-4e8f-a1b7-0c5d2e9f8a13"
+		self.assertEqual(self._decode(protocol.encode_modify_order(9, order_id, quote)),
+						 {"client_ref": 9, "order_id": order_id, "quote": quote})
+		self.assertEqual(self._decode(protocol.encode_cancel_order(10, order_id)),
+						 {"client_ref": 10, "order_id": order_id})
+
+	def test_reports(self):
+		order_id = "9f4a6c1e-3b2d-4e8f-a1b7-0c5d2e9f8a13"
+		trade_id = "1c2b3a4d-5e6f-4a8b-9c0d-e1f2a3b4c5d6"
+		report = self._decode(protocol.encode_execution_report(
+			3, protocol.STATUS_FILLED, order_id, protocol.encode_price("100"), 10, 0,
+			[(trade_id, protocol.encode_price("99.5"), 10)]))
+		self.assertEqual(report["price"], Decimal("100"))
+		self.assertEqual(report["fills"], [{"trade_id": trade_id, "price": Decimal("99.5"), "quantity": 10}])
+		reject = self._decode(protocol.encode_reject(4, "PRICE_ERROR", "Price must be greater than 0."))
+		self.assertEqual(reject, {"client_ref": 4, "error": "PRICE_ERROR", "reason": "Price must be greater than 0."})
+		with self.assertRaises(protocol.ProtocolError):
+			protocol.decode(b"Z", b"")
+
+class _frame_writer(object):
+
+	def __init__(self):
+		self.frames = []
+
+	def write(self, data):
+		self.frames.append(data)
+
+	async def drain(self):
+		pass
+
+class test_gateway(unittest.TestCase):
+
+	def test_reply_errors(self):
+		writer = _frame_writer()
+		async def replies():
+			pending = asyncio.Queue()
+			failed = asyncio.get_running_loop().create_future()
+			failed.set_exception(RuntimeError("Journal is full."))
+			pending.put_nowait((5, {"command": "cancel", "order_id": "a"}, failed))
+			pending.put_nowait(protocol.encode_reject(6, "ORDER_ERROR", "No order with that order ID currently exists."))
+			pending.put_nowait(None)
+			await gateway._reply_loop(pending, writer)
+		asyncio.run(replies())
+		header = protocol.FRAME_HEADER.size
+		rejects = [protocol.decode(frame[header - 1:header], frame[header:]) for frame in writer.frames]
+		self.assertEqual(rejects, [
+			{"client_ref": 5, "error": "INTERNAL_ERROR", "reason": "Journal is full."},
+			{"client_ref": 6, "error": "ORDER_ERROR", "reason": "No order with that order ID currently exists."}
+		])
+
+class test_book_views(unittest.TestCase):
+
+	def setUp(self):
+		self.order_book = OrderBook("KEQ")
+		for i in range(1, 10):
+			quote = dict(test_quotes[str(i)])
+			if "price" in quote:
+				quote["price"] = Decimal(str(quote["price"]))
+			self.order_book.process_order(quote)
+		exchange._publish_book(self.order_book, 9)
+		self.client = exchange.app.test_client()
+
+	def tearDown(self):
+		exchange.book_views.clear()
+
+	def test_depth(self):
+		response = self.client.get("/v1/order/book?depth=1")
+		book = json.loads(response.data)
+		self.assertEqual(list(book["asks"]), [str(self.order_book.get_min_ask())])
+		self.assertEqual(list(book["bids"]), [str(self.order_book.get_max_bid())])
+		self.assertEqual(book["ask_volume"], self.order_book.ask_volume)
+		full = json.loads(self.client.get("/v1/order/book").data)
+		self.assertEqual(list(full["asks"]), [str(price) for price in sorted(self.order_book.depth()[1])])
+		cached = self.client.get("/v1/order/book?depth=1", headers={"If-None-Match": response.headers["ETag"]})
+		self.assertEqual(cached.status_code, 304)
+		self.assertEqual(cached.data, b"")
+		self.assertIn("DEPTH_ERROR", self.client.get("/v1/order/book?depth=-1").get_data(as_text=True))
+
+	def test_patch(self):
+		etag = self.client.get("/v1/order/book").headers["ETag"]
+		quote = {"account_id": "1", "side": "SELL", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(200), "quantity": 10}
+		bids, asks = self.order_book.process_order(quote).levels
+		exchange._publish_book(self.order_book, 10, {"bids": bids, "asks": asks, "trades": []})
+		view = exchange.book_views["KEQ"]
+		self.assertEqual((view["bids"], view["asks"]), self.order_book.depth()[:2])
+		self.assertEqual(view["feed_seq"], 1)
+		response = self.client.get("/v1/order/book", headers={"If-None-Match": etag})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(json.loads(response.data)["asks"]["200"], 10)
+
+class test_risk_engine(unittest.TestCase):
+
+	def setUp(self):
+		self.order_book = OrderBook("KEQ")
+		self.now = [0.0]
+		self.risk = RiskEngine({"max_open_quantity": 15, "max_notional": Decimal(2000)},
+							   {"2": {"max_orders_per_second": 2, "price_collar": Decimal("0.1")}},
+							   clock=lambda: self.now[0])
+
+	def place(self, account_id, side, price, quantity):
+		quote = {"account_id": account_id, "side": side, "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(price), "quantity": quantity}
+		self.risk.check(self.order_book, quote)
+		report = self.order_book.process_order(quote)
+		self.risk.update(report.changed_orders)
+		return report.order
+
+	def test_exposure(self):
+		self.place("1", "BUY", 100, 10)
+		self.assertEqual(self.risk.exposure("1"), (10, Decimal(1000)))
+		with self.assertRaises(RiskError):
+			self.place("1", "BUY", 100, 6)
+		with self.assertRaises(RiskError):
+			self.place("1", "BUY", 250, 5)
+		self.place("3", "SELL", 100, 4)
+		self.assertEqual(self.risk.exposure("1"), (6, Decimal(600)))
+		self.place("3", "SELL", 100, 6)
+		self.assertEqual(self.risk.exposure("1"), (0, 0))
+		order = self.place("1", "SELL", 150, 5)
+		self.assertEqual(self.risk.exposure("1"), (5, Decimal(750)))
+		self.risk.update(self.order_book.cancel_order(order.order_id).changed_orders)
+		self.assertEqual(self.risk.exposure("1"), (0, 0))
+		self.assertEqual(self.risk.stats(), {"accounts": 0, "orders": 0, "rejects": 2})
+
+	def test_replace(self):
+		order = self.place("1", "BUY", 100, 10)
+		quote = {"account_id": "1", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(100), "quantity": 15}
+		self.risk.check(self.order_book, quote, replaces=order.order_id)
+		with self.assertRaises(RiskError):
+			self.risk.check(self.order_book, quote)
+
+	def test_rate_and_collar(self):
+		self.place("1", "BUY", 100, 1)
+		self.place("1", "SELL", 102, 1)
+		self.place("2", "BUY", 95, 1)
+		with self.assertRaises(RiskError):
+			self.place("2", "BUY", 80, 1)
+		self.place("2", "SELL", 110, 1)
+		with self.assertRaises(RiskError):
+			self.place("2", "BUY", 95, 1)
+		self.now[0] = 1.0
+		self.place("2", "BUY", 95, 1)
+
+	def test_batch(self):
+		quotes = [{"account_id": "1", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+				   "price": Decimal(100), "quantity": quantity} for quantity in (10, 10, 5)]
+		errors = self.risk.check_all(self.order_book, quotes)
+		self.assertEqual([error is None for error in errors], [True, False, True])
+		self.assertIsInstance(errors[1], RiskError)
+
+	def test_float_limits(self):
+		risk = RiskEngine({"max_notional": 2000.0, "price_collar": 0.1})
+		self.place("1", "BUY", 100, 1)
+		self.place("1", "SELL", 102, 1)
+		quote = {"account_id": "2", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(95), "quantity": 1}
+		risk.check(self.order_book, quote)
+		with self.assertRaises(RiskError):
+			risk.check(self.order_book, dict(quote, price=Decimal(80)))
+		with self.assertRaises(RiskError):
+			risk.check(self.order_book, dict(quote, quantity=30))
+		self.assertEqual(risk.limits["price_collar"], Decimal("0.1"))
+
+	def test_float_quantity(self):
+		quote = {"account_id": "1", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+				 "price": Decimal(100), "quantity": 10.0}
+		self.assertEqual(exchange.check_quote(quote), (True, []))
+		self.assertIs(type(quote["quantity"]), int)
+		self.assertEqual(exchange.check_quote(dict(quote, quantity=10.5))[1],
+						 [{"QUANTITY_ERROR": "Quantity must be a whole number."}])
+		self.assertEqual(exchange.check_quote(dict(quote, account_id="x" * 33))[1],
+						 [{"ACCOUNT_ERROR": "Account ID must be at most 32 bytes."}])
+		report = self.order_book.process_order(dict(quote, quantity=10.0))
+		self.risk.update(report.changed_orders)
+		self.assertEqual(self.risk.exposure("1"), (10, Decimal(1000)))
+
+	def test_execute_command(self):
+		# The outcome helpers read the module globals that start() normally sets up.
+		with mock.patch.object(exchange, "registry", OrderBookRegistry(["KEQ"]), create=True), \
+				mock.patch.object(exchange, "risk", self.risk):
+			quotes = [{"account_id": "1", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+					   "price": Decimal(100), "quantity": quantity} for quantity in (10, 10, 5)]
+			record = {"command": "batch", "quotes": quotes, "order_ids": ["a", "b", "c"],
+					  "timestamps": [datetime.now()] * 3}
+			outcome = exchange._execute_command(record)
+			self.assertEqual(record["order_ids"], ["a", "c"])
+			self.assertEqual([order["order_id"] for order in outcome["result"] if isinstance(order, dict)], ["a", "c"])
+			self.assertIsInstance(outcome["result"][1], RiskError)
+			self.assertEqual(self.risk.exposure("1"), (15, Decimal(1500)))
+			outcome = exchange._execute_command({"command": "edit", "order_id": "a", "quote": dict(quotes[0], quantity=11),
+												 "new_order_id": "d", "timestamp": datetime.now()})
+			self.assertIsInstance(outcome["error"], RiskError)
+			self.assertFalse(outcome["journal"])
+			self.assertIsNotNone(exchange.registry.get("KEQ").get_order("a"))
+			record = {"command": "batch", "quotes": [dict(quotes[0], quantity=20)], "order_ids": ["e"],
+					  "timestamps": [datetime.now()]}
+			outcome = exchange._execute_command(record)
+			self.assertFalse(outcome["journal"])
+			self.assertIsInstance(outcome["result"][0], RiskError)
+			self.assertIsNone(replay.apply_command(exchange.registry, record))
+
+	def test_execute_commands(self):
+		with mock.patch.object(exchange, "registry", OrderBookRegistry(["KEQ"]), create=True), \
+				mock.patch.object(exchange, "risk", RiskEngine()):
+			quote = {"account_id": "1", "side": "BUY", "order_type": "LIMIT", "symbol": "KEQ",
+					 "price": Decimal(100), "quantity": 10}
+			outcomes = exchange._execute_commands([
+				{"command": "new", "quote": quote, "order_id": "a", "timestamp": datetime.now()},
+				{"command": "cancel", "order_id": "a"},
+				{"command": "cancel", "order_id": "a"}
+			])
+			self.assertFalse(outcomes[0]["result"]["was_filled"])
+			self.assertTrue(outcomes[1]["result"])
+			self.assertIsInstance(outcomes[2]["error"], OrderError)
+			self.assertEqual([outcome["journal"] for outcome in outcomes], [True, True, False])
+
+class test_market_data_feed(unittest.TestCase):
+
+	def test_subscribe(self):
+		views = {"KEQ": {"seq": 3, "feed_seq": 0, "bids": {Decimal("99.5"): 5}, "asks": {}}}
+		feed = MarketDataFeed(views)
+		async def session():
+			server = await feed.serve("127.0.0.1", 0)
+			reader, writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+			writer.write(b'{"subscribe": ["KEQ", "XXX"]}\n')
+			messages = [json.loads(await reader.readline()) for _ in range(2)]
+			for seq in (1, 2):
+				feed.publish({"type": "delta", "symbol": "KEQ", "seq": seq, "journal_seq": 3 + seq,
+							  "bids": {"99.5": 5 - seq}, "asks": {}, "trades": []})
+			messages += [json.loads(await reader.readline()) for _ in range(2)]
+			writer.close()
+			server.close()
+			await server.wait_closed()
+			return messages
+		snapshot, error, first, second = asyncio.run(session())
+		self.assertEqual(snapshot, {"type": "snapshot", "symbol": "KEQ", "seq": 0, "journal_seq": 3,
+									"bids": {"99.5": 5}, "asks": {}})
+		self.assertEqual(error["error"], "SYMBOL_ERROR")
+		self.assertEqual([first["seq"], second["seq"]], [1, 2])
+		self.assertEqual(second["bids"], {"99.5": 3})
+		self.assertEqual(feed.stats(), {"subscribers": 0, "messages": 2, "flushes": 1, "resyncs": 0})
+
+class test_async_server(unittest.TestCase):
+
+	def test_keep_alive(self):
+		async def echo(scope, receive, send):
+			body = (await receive())["body"]
+			await send({"type": "http.response.start", "status": 200, "headers": []})
+			await send({"type": "http.response.body", "body": scope["method"].encode() + body})
+		loop = asyncio.new_event_loop()
+		server = loop.run_until_complete(async_server.serve(echo, "127.0.0.1", 0))
+		port = server.sockets[0].getsockname()[1]
+		thread = threading.Thread(target=loop.run_forever)
+		thread.start()
+		try:
+			results = loadtest.run_load(f"http://127.0.0.1:{port}", "new", connections=5, requests=50)
+		finally:
+			loop.call_soon_threadsafe(loop.stop)
+			thread.join()
+			server.close()
+			loop.run_until_complete(server.wait_closed())
+			loop.close()
+		self.assertEqual(results["requests"], 50)
+		self.assertEqual(results["errors"], 0)
+		self.assertEqual(results["reconnects"], 0)
+
+	def test_routes(self):
+		quote = {"symbol": "KEQ", "side": "BUY", "order_type": "LIMIT", "price": "100", "quantity": 5,
+				 "account_id": "1"}
+		status, body, headers = asyncio.run(async_server.handle("POST", "/v1/quote/verify", "",
+																json.dumps({"quote": quote}).encode()))
+		self.assertEqual(status, 200)
+		self.assertTrue(json.loads(body)["valid"])
+		self.assertEqual(asyncio.run(async_server.handle("GET", "/v1/missing", "", b""))[0], 404)
+		self.assertEqual(asyncio.run(async_server.handle("GET", "/v1/order/new", "", b""))[0], 405)
 
 class test_exchange(unittest.TestCase):
 
@@ -165,5 +1255,22 @@ class test_exchange(unittest.TestCase):
 		self.assertEqual(resp.status_code, 200)
 		self.assertEqual(resp.json()["order"]["was_placed"], True)
 
+	def test_order_status_batch(self):
+		url1 = 'http://localhost:5000/v1/order/new'
+		data1 = {
+			"quote": test_quotes[str(1)]
+		}
+		headers1 = {'Content-type': 'application/json'}
+		resp1 = requests.post(url1, data=json.dumps(data1), headers=headers1)
+		url = 'http://localhost:5000/v1/order/status/batch'
+		data = {
+			"order_ids": [resp1.json()["order"]["order_id"], "missing"]
+		}
+		headers = {'Content-type': 'application/json'}
+		resp = requests.post(url, data=json.dumps(data), headers=headers)
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.json()["orders"][0]["order"]["was_placed"], True)
+		self.assertTrue(resp.json()["orders"][1]["errors"])
+
 if __name__=="__main__":
     unittest.main()
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+DUPLICATE_KEY = 11000
+
+
+class BulkWriter(object):
+
+    def __init__(self, db, batch_size=500, flush_interval=0.05, max_queue=10000, retry_interval=1.0):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.queue = queue.Queue(max_queue)
+        self.queued = 0
+        self.written = 0
+        self.closed = False
+        self.metrics = {
+            "documents": 0,
+            "batches": 0,
+            "errors": 0,
+            "blocked_puts": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0
+        }
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def put(self, collection, document, key=None):
+        # With a key the document replaces any stored one with the same key value instead of being
+        # inserted, so writing it again is harmless.
+        with self.condition:
+            if self.closed:
+                raise WriterError("Writer has been closed.")
+            self.queued += 1
+        try:
+            self.queue.put_nowait((collection, document, key))
+        except queue.Full:
+            with self.condition:
+                self.metrics["blocked_puts"] += 1
+            self.queue.put((collection, document, key))
+
+    def flush(self, timeout=None):
+        with self.condition:
+            queued = self.queued
+            return self.condition.wait_for(lambda: self.written >= queued, timeout)
+
+    def stats(self):
+        with self.condition:
+            stats = dict(self.metrics)
+            stats["queue_depth"] = self.queued - self.written
+        return stats
+
+    def close(self, timeout=None):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+        self.queue.put(_CLOSE)
+        self.thread.join(timeout)
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while item is not _CLOSE and len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(item)
+            closing = batch[-1] is _CLOSE
+            if closing:
+                batch.pop()
+            if batch:
+                self._write(batch)
+            if closing:
+                return
+
+    def _write(self, batch):
+        collections = {}
+        for collection, document, key in batch:
+            collections.setdefault((collection, key), []).append(document)
+        start = time.perf_counter()
+        while collections:
+            (collection, key), documents = next(iter(collections.items()))
+            try:
+                if key:
+                    self.db[collection].bulk_write([ReplaceOne({key: document[key]}, document, upsert=True)
+                                                    for document in documents], ordered=False)
+                else:
+                    self.db[collection].insert_many(documents, ordered=False)
+            except BulkWriteError as err:
+                # insert_many assigns _id before sending, so a retried batch only
+                # conflicts with the documents that already made it in.
+                if any(error["code"] != DUPLICATE_KEY for error in err.details["writeErrors"]):
+                    self._retry()
+                    continue
+            except PyMongoError:
+                self._retry()
+                continue
+            del collections[(collection, key)]
+        flush_ms = (time.perf_counter() - start) * 1000
+        with self.condition:
+            self.written += len(batch)
+            self.metrics["documents"] += len(batch)
+            self.metrics["batches"] += 1
+            self.metrics["last_batch_size"] = len(batch)
+            self.metrics["last_flush_ms"] = flush_ms
+            self.metrics["max_flush_ms"] = max(self.metrics["max_flush_ms"], flush_ms)
+            self.condition.notify_all()
+
+    def _retry(self):
+        with self.condition:
+            self.metrics["errors"] += 1
+        time.sleep(self.retry_interval)
+
+_CLOSE = object()
+
+class WriterError(Exception):
+    pass